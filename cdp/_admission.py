@@ -0,0 +1,69 @@
+from __future__ import print_function
+
+from dask.utils import parse_bytes
+from cdp._worker_pool import process_pool
+
+
+def call_pickled(pickled_func, *args):
+    # The function is pickled with cloudpickle, like dask does,
+    # so functions defined in the driver or in closures still work.
+    import cloudpickle
+    return cloudpickle.loads(pickled_func)(*args)
+
+def _estimate(parameter):
+    """
+    Return the memory in bytes the parameter is expected to use, or 0 if it's unknown.
+    """
+    estimate_memory = getattr(parameter, 'estimate_memory', None)
+    estimate = estimate_memory() if estimate_memory else None
+    return parse_bytes(estimate) if estimate else 0
+
+def run_with_memory_limit(func, parameters, memory_limit, num_workers, context, executor=None):
+    """
+    Run func with the parameters in a pool of num_workers processes, or in the
+    executor if it's given, only starting a task when its estimated memory
+    fits in what's left of memory_limit.
+    Tasks are started in order, but a task that doesn't fit is skipped
+    until there's room, so smaller tasks after it can fill the gap.
+    A task larger than memory_limit is run by itself.
+    """
+    memory_limit = parse_bytes(memory_limit)
+    estimates = [_estimate(p) for p in parameters]
+    import cloudpickle
+    pickled_func = cloudpickle.dumps(func)
+
+    if executor is None:
+        with process_pool(num_workers, context) as pool:
+            return _run(pool, pickled_func, parameters, estimates, memory_limit, num_workers)
+    return _run(executor, pickled_func, parameters, estimates, memory_limit, num_workers)
+
+def _run(pool, pickled_func, parameters, estimates, memory_limit, num_workers):
+    import concurrent.futures
+    results = [None] * len(parameters)
+    waiting = list(range(len(parameters)))
+    running = {}
+    memory_used = 0
+
+    try:
+        while waiting or running:
+            for i in list(waiting):
+                if len(running) >= num_workers:
+                    break
+                if running and memory_used + estimates[i] > memory_limit:
+                    continue
+                waiting.remove(i)
+                running[pool.submit(call_pickled, pickled_func, parameters[i])] = i
+                memory_used += estimates[i]
+
+            done, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                i = running.pop(future)
+                memory_used -= estimates[i]
+                results[i] = future.result()
+    except:
+        for future in running:
+            future.cancel()
+        raise
+
+    return results
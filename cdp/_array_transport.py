@@ -0,0 +1,104 @@
+from __future__ import print_function
+
+import os
+import copy
+import shutil
+import tempfile
+
+# Arrays smaller than this are cheaper to just pickle.
+MIN_BYTES = 1024 * 1024
+
+
+def result_dir(path=None):
+    """
+    Make a directory for the array results in path, or in shared memory
+    (/dev/shm) if it's available, and the default temp directory otherwise.
+    """
+    if path is None and os.path.isdir('/dev/shm'):
+        path = '/dev/shm'
+    return tempfile.mkdtemp(prefix='cdp_results_', dir=path)
+
+
+class ArrayHandle(object):
+    """
+    What's sent back to the parent process instead of an array.
+    """
+    def __init__(self, path):
+        self.path = path
+
+
+def _map_values(obj, func):
+    """
+    Return a copy of the list, tuple or dict obj with func applied to each of
+    its values, or None if obj isn't one. Subclasses like namedtuples and
+    defaultdicts are kept. Ones that can't be created like that are
+    returned unchanged, so their arrays are just pickled.
+    """
+    if isinstance(obj, dict):
+        new_obj = copy.copy(obj)
+        for k, v in obj.items():
+            new_obj[k] = func(v)
+        return new_obj
+    elif isinstance(obj, tuple) and hasattr(obj, '_fields'):
+        return type(obj)(*[func(v) for v in obj])
+    elif isinstance(obj, (list, tuple)):
+        if type(obj) in (list, tuple):
+            return type(obj)(func(v) for v in obj)
+        try:
+            return type(obj)([func(v) for v in obj])
+        except TypeError:
+            return obj
+    return None
+
+def _to_handles(obj, dir_name, numpy):
+    # Subclasses like masked arrays can't be saved
+    # like this or would lose their type, so they're pickled.
+    if type(obj) is numpy.ndarray and obj.dtype != object and obj.nbytes >= MIN_BYTES:
+        fd, path = tempfile.mkstemp(dir=dir_name, suffix='.npy')
+        with os.fdopen(fd, 'wb') as f:
+            numpy.save(f, obj, allow_pickle=False)
+        return ArrayHandle(path)
+    new_obj = _map_values(obj, lambda v: _to_handles(v, dir_name, numpy))
+    return obj if new_obj is None else new_obj
+
+def _from_handles(obj, numpy):
+    if isinstance(obj, ArrayHandle):
+        # Copy-on-write, so the array can be changed without touching the file.
+        array = numpy.load(obj.path, mmap_mode='c')
+        # The mapping stays valid after the file is removed, and
+        # the memory is freed when the array is garbage collected.
+        os.remove(obj.path)
+        return array
+    new_obj = _map_values(obj, lambda v: _from_handles(v, numpy))
+    return obj if new_obj is None else new_obj
+
+
+class ArrayResultFunc(object):
+    """
+    Wraps func so that any large NumPy arrays in its result, including ones in
+    lists, tuples and dicts, are saved to dir_name and replaced by ArrayHandles.
+    """
+    def __init__(self, func, dir_name):
+        self.func = func
+        self.dir_name = dir_name
+
+    def __call__(self, parameter):
+        result = self.func(parameter)
+        try:
+            import numpy
+        except ImportError:
+            return result
+        return _to_handles(result, self.dir_name, numpy)
+
+
+def load_results(results, dir_name):
+    """
+    Replace the ArrayHandles in the results with memory-mapped arrays
+    and remove dir_name, without copying the data of the arrays.
+    """
+    try:
+        import numpy
+        results = [_from_handles(r, numpy) for r in results]
+    finally:
+        shutil.rmtree(dir_name, True)
+    return results
@@ -0,0 +1,57 @@
+"""
+The asyncio runners for cdp_run. These are in their own
+module because the syntax needs Python 3.
+"""
+from __future__ import print_function
+
+import asyncio
+
+
+async def _run_one(coro_func, parameter, semaphore):
+    if semaphore is None:
+        return parameter, await coro_func(parameter)
+    async with semaphore:
+        return parameter, await coro_func(parameter)
+
+async def _make_semaphore(concurrency):
+    # The semaphore is created in a coroutine so it's bound to the running loop.
+    return asyncio.Semaphore(concurrency) if concurrency else None
+
+async def _gather(coro_func, parameters, concurrency):
+    semaphore = await _make_semaphore(concurrency)
+    pairs = await asyncio.gather(*[_run_one(coro_func, p, semaphore) for p in parameters])
+    return [result for _, result in pairs]
+
+def run(coro_func, parameters, concurrency=None):
+    """
+    Run coro_func with all of the parameters on a new event loop,
+    with at most concurrency of them at once. Return the results in order.
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(_gather(coro_func, parameters, concurrency))
+    finally:
+        loop.close()
+
+def iterate(coro_func, parameters, concurrency=None):
+    """
+    Like run(), but yield ``(parameter, result)`` pairs as they finish.
+    """
+    loop = asyncio.new_event_loop()
+    pending = set()
+    try:
+        semaphore = loop.run_until_complete(_make_semaphore(concurrency))
+        pending = set(loop.create_task(_run_one(coro_func, p, semaphore)) for p in parameters)
+
+        while pending:
+            done, pending = loop.run_until_complete(
+                asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED))
+            for task in done:
+                yield task.result()
+    finally:
+        # The caller stopped early or a task failed, so cancel the rest.
+        for task in pending:
+            task.cancel()
+        if pending:
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        loop.close()
@@ -0,0 +1,72 @@
+from __future__ import print_function
+
+import os
+import pickle
+import tempfile
+from cdp._fingerprint import fingerprint
+
+# os.replace() isn't in Python 2, but os.rename() is atomic on POSIX.
+_replace = getattr(os, 'replace', os.rename)
+
+
+class CheckpointStore(object):
+    """
+    A directory of results, one file per parameter, keyed
+    by the fingerprint of the parameter used to create it.
+    """
+    def __init__(self, path):
+        # Workers can have another working directory than the driver.
+        self.path = os.path.abspath(path)
+        if not os.path.exists(self.path):
+            try:
+                os.makedirs(self.path)
+            except OSError:
+                # Another worker might've just created it.
+                if not os.path.isdir(self.path):
+                    raise
+
+    def _file(self, parameter):
+        return os.path.join(self.path, '{}.pkl'.format(fingerprint(parameter)))
+
+    def __contains__(self, parameter):
+        return os.path.exists(self._file(parameter))
+
+    def load(self, parameter):
+        """
+        Return the stored result of the parameter.
+        """
+        with open(self._file(parameter), 'rb') as f:
+            return pickle.load(f)
+
+    def save(self, parameter, result):
+        """
+        Store the result of the parameter. The result is written to
+        a temporary file first and then renamed, so a crash while
+        writing never leaves a partial result in the store.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(result, f, pickle.HIGHEST_PROTOCOL)
+                f.flush()
+                os.fsync(f.fileno())
+            _replace(tmp_path, self._file(parameter))
+        except:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+class CheckpointedFunc(object):
+    """
+    Wraps func so that its result is saved in the
+    store as soon as it's computed, even in another process.
+    """
+    def __init__(self, func, store):
+        self.func = func
+        self.store = store
+
+    def __call__(self, parameter):
+        result = self.func(parameter)
+        self.store.save(parameter, result)
+        return result
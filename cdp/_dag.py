@@ -0,0 +1,124 @@
+from __future__ import print_function
+
+import heapq
+from cdp._admission import call_pickled
+from cdp._worker_pool import process_pool
+from cdp import _shared
+
+
+def dependencies(parameters):
+    """
+    Return the indices of the parameters that each parameter depends on.
+    The depends_on attribute of a parameter is a list of other parameters,
+    or of the name attribute of other parameters.
+    """
+    index_of_id = dict((id(p), i) for i, p in enumerate(parameters))
+    index_of_name = {}
+    for i, p in enumerate(parameters):
+        name = getattr(p, 'name', None)
+        if isinstance(name, str):
+            index_of_name[name] = i
+
+    deps = []
+    for p in parameters:
+        p_deps = []
+        for d in getattr(p, 'depends_on', None) or []:
+            if isinstance(d, str) and d in index_of_name:
+                p_deps.append(index_of_name[d])
+            elif id(d) in index_of_id:
+                p_deps.append(index_of_id[id(d)])
+            else:
+                raise RuntimeError('Dependency {} is not one of the parameters.'.format(d))
+        deps.append(p_deps)
+
+    # Make sure there isn't a cycle before running anything.
+    topological_order(deps)
+    return deps
+
+def topological_order(deps):
+    """
+    Return the indices of the parameters in an order where each one comes after
+    its dependencies, preferring the original order when there's a choice.
+    """
+    n_deps = [len(d) for d in deps]
+    dependents = _dependents(deps)
+    ready = [i for i, n in enumerate(n_deps) if n == 0]
+    heapq.heapify(ready)
+    order = []
+    while ready:
+        i = heapq.heappop(ready)
+        order.append(i)
+        for j in dependents[i]:
+            n_deps[j] -= 1
+            if n_deps[j] == 0:
+                heapq.heappush(ready, j)
+    if len(order) != len(deps):
+        raise RuntimeError('The dependencies of the parameters have a cycle.')
+    return order
+
+def _dependents(deps):
+    dependents = [[] for _ in deps]
+    for i, d in enumerate(deps):
+        for j in d:
+            dependents[j].append(i)
+    return dependents
+
+def run_serial(func, parameters, deps):
+    results = [None] * len(parameters)
+    for i in topological_order(deps):
+        results[i] = func(parameters[i], [results[j] for j in deps[i]])
+    return results
+
+def run_processes(func, parameters, deps, num_workers, context, executor=None):
+    """
+    Run each task in a pool of processes as soon as all of its dependencies are done.
+    """
+    if executor is None:
+        with process_pool(num_workers, context) as pool:
+            return run_processes(func, parameters, deps, num_workers, context, pool)
+
+    import concurrent.futures
+    import cloudpickle
+    pickled_func = cloudpickle.dumps(func)
+    results = [None] * len(parameters)
+    n_deps = [len(d) for d in deps]
+    dependents = _dependents(deps)
+    running = {}
+
+    def start(i):
+        inputs = [results[j] for j in deps[i]]
+        running[executor.submit(call_pickled, pickled_func, parameters[i], inputs)] = i
+
+    for i, n in enumerate(n_deps):
+        if n == 0:
+            start(i)
+
+    while running:
+        done, _ = concurrent.futures.wait(
+            running, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            i = running.pop(future)
+            results[i] = future.result()
+            for j in dependents[i]:
+                n_deps[j] -= 1
+                if n_deps[j] == 0:
+                    start(j)
+
+    return results
+
+def run_distributed(client, func, parameters, deps, shared_objects=None):
+    """
+    Run the tasks on the dask client. shared_objects are the futures
+    of the objects scattered with _shared.scattered_futures(), if any.
+    """
+    # The scheduler starts each task once the futures it's given are done,
+    # and the results of the dependencies don't go through the client.
+    kwargs = {'pure': False}
+    if shared_objects:
+        kwargs.update(task_func=func, shared_objects=shared_objects)
+        func = _shared.call_with_scattered
+    futures = [None] * len(parameters)
+    for i in topological_order(deps):
+        futures[i] = client.submit(func, parameters[i], [futures[j] for j in deps[i]],
+                                   **kwargs)
+    return client.gather(futures)
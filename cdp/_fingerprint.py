@@ -0,0 +1,96 @@
+from __future__ import print_function
+
+import hashlib
+import functools
+import pickle
+import types
+import six
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Values of these types have a repr() with everything in them.
+_REPR_TYPES = (type(None), bool, float, complex, bytes) + \
+    six.integer_types + six.string_types
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _canonical_code(code):
+    consts = ','.join(_canonical_code(c) if isinstance(c, types.CodeType) else _canonical(c)
+                      for c in code.co_consts)
+    return 'code({},{},({}))'.format(_sha256(code.co_code), _canonical(code.co_names), consts)
+
+def _canonical_function(func):
+    """
+    Lambdas and nested functions can't be told apart by their name,
+    so they're compared by their code, defaults and closure.
+    """
+    cells = []
+    for cell in func.__closure__ or ():
+        try:
+            value = cell.cell_contents
+        except ValueError:
+            # The variable isn't assigned yet.
+            cells.append('<empty>')
+            continue
+        cells.append('<self>' if value is func else _canonical(value))
+    return 'function({}.{},{},{},[{}])'.format(
+        func.__module__, func.__name__, _canonical_code(func.__code__),
+        _canonical(func.__defaults__), ','.join(cells))
+
+def _canonical(obj):
+    """
+    Return a string for obj that's the same across processes
+    and runs for objects with the same contents.
+    """
+    if isinstance(obj, dict):
+        items = sorted((_canonical(k), _canonical(v)) for k, v in obj.items())
+        return '{' + ','.join('{}:{}'.format(k, v) for k, v in items) + '}'
+    elif isinstance(obj, (list, tuple)):
+        s = ','.join(_canonical(v) for v in obj)
+        return '[{}]'.format(s) if isinstance(obj, list) else '({})'.format(s)
+    elif isinstance(obj, (set, frozenset)):
+        return 'set(' + ','.join(sorted(_canonical(v) for v in obj)) + ')'
+    elif isinstance(obj, types.ModuleType):
+        return 'module:{}'.format(obj.__name__)
+    elif isinstance(obj, functools.partial):
+        # The arguments aren't in its __dict__.
+        return 'partial({},{},{})'.format(
+            _canonical(obj.func), _canonical(obj.args), _canonical(obj.keywords or {}))
+    elif isinstance(obj, (types.FunctionType, types.BuiltinFunctionType, type)):
+        name = getattr(obj, '__qualname__', obj.__name__)
+        if isinstance(obj, types.FunctionType) and ('<' in name or obj.__closure__):
+            return _canonical_function(obj)
+        return '{}.{}'.format(obj.__module__, name)
+    elif numpy is not None and isinstance(obj, numpy.ndarray):
+        # The repr() of large arrays leaves out most of the values.
+        if obj.dtype.hasobject:
+            data = _canonical(obj.tolist())
+        else:
+            data = _sha256(numpy.ascontiguousarray(obj).tobytes())
+        return 'ndarray({},{},{})'.format(obj.dtype.str, obj.shape, data)
+    elif isinstance(obj, _REPR_TYPES):
+        return repr(obj)
+
+    # A custom repr() can leave out some of the state, so don't use it.
+    cls = type(obj)
+    if hasattr(obj, '__dict__'):
+        return '{}.{}({})'.format(cls.__module__, cls.__name__, _canonical(vars(obj)))
+    try:
+        return '{}.{}<{}>'.format(cls.__module__, cls.__name__,
+                                  _sha256(pickle.dumps(obj, 2)))
+    except Exception:
+        return repr(obj)
+
+def fingerprint(parameter):
+    """
+    Return a stable hash of the attributes of the parameter.
+    Parameters with the same attributes and values have the same fingerprint.
+    """
+    h_sha256 = hashlib.sha256()
+    h_sha256.update(_canonical(parameter).encode('utf-8'))
+    return h_sha256.hexdigest()
@@ -0,0 +1,100 @@
+from __future__ import print_function
+
+import os
+import csv
+import json
+import time
+import socket
+import threading
+from cdp._fingerprint import fingerprint
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows.
+    resource = None
+
+# CPU time of only the current thread, since a
+# process can run multiple tasks at once with threads.
+_cpu_time = getattr(time, 'thread_time', None) or getattr(time, 'process_time', None) or time.clock
+
+
+def _peak_rss():
+    """
+    Return the peak resident set size of this process in bytes, or None.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # It's in bytes on macOS, but kilobytes everywhere else.
+    return peak if os.uname()[0] == 'Darwin' else peak * 1024
+
+
+class InstrumentedFunc(object):
+    """
+    Wraps func so that it returns a tuple of its result, a record of how the
+    task ran, and the exception it raised. Exceptions aren't raised so that
+    the records of all of the tasks are still returned when some fail.
+    """
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, parameter):
+        result, exception = None, None
+        start, cpu_start = time.time(), _cpu_time()
+        try:
+            result = self.func(parameter)
+        except Exception as e:
+            exception = e
+
+        record = {
+            'fingerprint': fingerprint(parameter),
+            'wall_time': time.time() - start,
+            'cpu_time': _cpu_time() - cpu_start,
+            # This is the peak of the process, which may
+            # have run other tasks before this one.
+            'peak_rss': _peak_rss(),
+            'host': socket.gethostname(),
+            'pid': os.getpid(),
+            'thread': threading.current_thread().name,
+            'status': 'error' if exception is not None else 'success',
+            'exception': repr(exception) if exception is not None else None,
+        }
+        return result, record, exception
+
+
+def failed_record(parameter, exception):
+    """
+    Return the record of a task that didn't return, like one that timed out.
+    """
+    record = dict((field, None) for field in RunReport.FIELDS if field != 'index')
+    record.update(fingerprint=fingerprint(parameter), status='error',
+                  exception=repr(exception))
+    return record
+
+
+class RunReport(object):
+    """
+    The record of each task of a run, in the order of the parameters.
+    Pass it to any of the cdp_run engines with ``report=`` to fill it.
+    """
+    FIELDS = ['index', 'fingerprint', 'status', 'wall_time', 'cpu_time',
+              'peak_rss', 'host', 'pid', 'thread', 'exception']
+
+    def __init__(self):
+        self.records = []
+
+    def add(self, record):
+        record = dict(record, index=len(self.records))
+        self.records.append(record)
+
+    def to_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.records, f, indent=2)
+
+    def to_csv(self, path):
+        with open(path, 'w') as f:
+            writer = csv.DictWriter(f, fieldnames=self.FIELDS)
+            writer.writeheader()
+            for record in self.records:
+                writer.writerow(record)
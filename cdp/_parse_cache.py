@@ -0,0 +1,150 @@
+from __future__ import print_function
+
+import os
+import sys
+import time
+import pickle
+import hashlib
+import tempfile
+import yaml
+
+# os.replace() isn't in Python 2, but os.rename() is atomic on POSIX.
+_replace = getattr(os, 'replace', os.rename)
+
+# Change this when the way the files are parsed changes,
+# so the old cache entries aren't used anymore.
+PARSER_VERSION = 1
+
+# Entries that weren't used for this many seconds are removed.
+MAX_AGE = 30 * 24 * 60 * 60
+
+
+def default_cache_dir():
+    """
+    The directory of the cache. It's $CDP_CACHE_DIR if it's set,
+    otherwise cdp in $XDG_CACHE_HOME or ~/.cache.
+    """
+    if os.environ.get('CDP_CACHE_DIR'):
+        return os.environ['CDP_CACHE_DIR']
+    cache_home = os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'cdp')
+
+
+class ParseCache(object):
+    """
+    A directory of the parsed contents of parameter files, one file per
+    parameter file. The key of each is the hash of the path of the
+    parameter file and the hash of its contents along with the version
+    of the parser, so changing the file or the parser creates a new entry.
+    Saving an entry removes the older ones of the same parameter file
+    and the ones that weren't used for MAX_AGE seconds.
+    The cache isn't used when $CDP_PARSE_CACHE is '0'.
+    Failing to read or write the cache is never an error, the
+    file is just parsed again.
+    """
+    def __init__(self, path=None):
+        self._path = path
+
+    @property
+    def path(self):
+        return self._path if self._path else default_cache_dir()
+
+    def _enabled(self):
+        return os.environ.get('CDP_PARSE_CACHE') != '0'
+
+    def _key(self, file_path, kind):
+        """
+        The hash of the path of file_path, so all of the entries of the
+        same file can be found, followed by the hash of its contents.
+        """
+        path_sha256 = hashlib.sha256(
+            '{}:{}'.format(kind, os.path.abspath(file_path)).encode())
+
+        h_sha256 = hashlib.sha256()
+        h_sha256.update('{}:{}:{}:{}:'.format(
+            kind, PARSER_VERSION, sys.version_info[0], yaml.__version__).encode())
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h_sha256.update(chunk)
+        return '{}-{}'.format(path_sha256.hexdigest(), h_sha256.hexdigest())
+
+    def _file(self, key):
+        return os.path.join(self.path, '{}.pkl'.format(key))
+
+    def get(self, file_path, kind, parse):
+        """
+        Return the parsed contents of file_path, either from
+        the cache or by calling parse(file_path) and storing it.
+        kind is the type of file, like 'cfg' or 'json'.
+        """
+        if not self._enabled():
+            return parse(file_path)
+
+        key = self._key(file_path, kind)
+        try:
+            with open(self._file(key), 'rb') as f:
+                contents = pickle.load(f)
+        except Exception:
+            pass
+        else:
+            # The modification time is when the entry was last used.
+            try:
+                os.utime(self._file(key), None)
+            except OSError:
+                pass
+            return contents
+
+        contents = parse(file_path)
+        try:
+            self._save(key, contents)
+            self._prune(key)
+        except (OSError, IOError, pickle.PicklingError):
+            pass
+        return contents
+
+    def _save(self, key, contents):
+        """
+        The contents are written to a temporary file first and then renamed,
+        so other processes never read a partial entry.
+        """
+        if not os.path.isdir(self.path):
+            try:
+                os.makedirs(self.path)
+            except OSError:
+                # Another process might've just created it.
+                if not os.path.isdir(self.path):
+                    raise
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(contents, f, pickle.HIGHEST_PROTOCOL)
+            _replace(tmp_path, self._file(key))
+        except:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _prune(self, key):
+        """
+        Remove the other entries of the parameter file of key
+        and the ones that weren't used for MAX_AGE seconds.
+        """
+        path_key = key.split('-')[0]
+        now = time.time()
+        for name in os.listdir(self.path):
+            entry_key, ext = os.path.splitext(name)
+            if ext != '.pkl' or entry_key == key:
+                continue
+            entry_file = os.path.join(self.path, name)
+            try:
+                if entry_key.split('-')[0] == path_key or \
+                        now - os.path.getmtime(entry_file) > MAX_AGE:
+                    os.remove(entry_file)
+            except OSError:
+                # Another process might've just removed it.
+                pass
+
+
+parse_cache = ParseCache()
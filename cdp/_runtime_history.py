@@ -0,0 +1,73 @@
+from __future__ import print_function
+
+import os
+import json
+import time
+import tempfile
+from cdp._fingerprint import fingerprint
+
+# os.replace() isn't in Python 2, but os.rename() is atomic on POSIX.
+_replace = getattr(os, 'replace', os.rename)
+
+
+class RuntimeHistory(object):
+    """
+    The wall time of each parameter from previous runs, saved
+    in a JSON file and keyed by the fingerprint of the parameter.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._runtimes = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self._runtimes = json.load(f)
+
+    def expected_runtime(self, parameter):
+        """
+        Return how long the parameter took last time, or None if it's never been run.
+        """
+        return self._runtimes.get(fingerprint(parameter))
+
+    def record(self, parameter, seconds):
+        self._runtimes[fingerprint(parameter)] = seconds
+
+    def longest_first(self, parameters):
+        """
+        Return the indices of the parameters, ordered from longest
+        to shortest expected runtime. Parameters without a
+        runtime are put first, since they could be the longest.
+        """
+        def key(i):
+            runtime = self.expected_runtime(parameters[i])
+            return -runtime if runtime is not None else -float('inf')
+        # sorted() is stable, so ties stay in the original order.
+        return sorted(range(len(parameters)), key=key)
+
+    def save(self):
+        """
+        Write the history to a temporary file and then rename it,
+        so the previous history is kept if this is interrupted.
+        """
+        dir_name = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=dir_name, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self._runtimes, f)
+            _replace(tmp_path, self.path)
+        except:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+class TimedFunc(object):
+    """
+    Wraps func so that it returns a tuple of its result and the wall time it took.
+    """
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, parameter):
+        start = time.time()
+        result = self.func(parameter)
+        return result, time.time() - start
@@ -0,0 +1,135 @@
+from __future__ import print_function
+
+import os
+import atexit
+import pickle
+import shutil
+import tempfile
+
+# The objects registered with share(), in the process that registered them.
+_registered = {}
+# The objects that are available to tasks in this process.
+_attached = {}
+# The file each object in _attached was loaded from, if any.
+_attached_files = {}
+# Paths of the files the registered objects were written to for multiprocessing.
+_files = {}
+_tmp_dir = None
+# Futures of the scattered objects, for each client.
+_scattered = {}
+
+
+def share(name, obj):
+    """
+    Register a read-only object that's used by all of the tasks,
+    so it's sent to each worker once instead of with every parameter.
+    In the task, get it with shared(name).
+    """
+    unshare(name)
+    _registered[name] = obj
+    _attached[name] = obj
+
+def unshare(name):
+    """
+    Stop sharing the object registered as name.
+    """
+    _registered.pop(name, None)
+    _attached.pop(name, None)
+    path = _files.pop(name, None)
+    if path is not None and os.path.exists(path):
+        os.remove(path)
+    for futures in _scattered.values():
+        futures.pop(name, None)
+
+def shared(name):
+    """
+    Return the shared object registered as name.
+    """
+    try:
+        return _attached[name]
+    except KeyError:
+        raise KeyError('No object is shared as {}, use share() first.'.format(name))
+
+def _is_numpy_array(obj):
+    try:
+        import numpy
+    except ImportError:
+        return False
+    # Subclasses like masked arrays can't be saved
+    # as .npy files or would lose their type, so they're pickled.
+    return type(obj) is numpy.ndarray and obj.dtype != object
+
+def file_handles():
+    """
+    Write each registered object to a file once, and return what's needed for
+    another process to attach to them. NumPy arrays are saved as .npy files that
+    are memory-mapped by the workers, so they share the same pages without copying.
+    Other objects are pickled and loaded once per worker process.
+    """
+    global _tmp_dir
+    if _registered and _tmp_dir is None:
+        _tmp_dir = tempfile.mkdtemp(prefix='cdp_shared_')
+        atexit.register(shutil.rmtree, _tmp_dir, True)
+
+    handles = {}
+    for name, obj in _registered.items():
+        is_array = _is_numpy_array(obj)
+        if name not in _files:
+            fd, path = tempfile.mkstemp(dir=_tmp_dir, suffix='.npy' if is_array else '.pkl')
+            with os.fdopen(fd, 'wb') as f:
+                if is_array:
+                    import numpy
+                    numpy.save(f, obj, allow_pickle=False)
+                else:
+                    pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL)
+            _files[name] = path
+        handles[name] = ('npy' if is_array else 'pickle', _files[name])
+    return handles
+
+def scattered_futures(client):
+    """
+    Scatter each registered object to all of the workers of the client
+    once, and return the futures for them.
+    """
+    futures = _scattered.setdefault(client.id, {})
+    for name, obj in _registered.items():
+        if name not in futures:
+            # Scatter a list so that lists and dicts aren't split up.
+            futures[name] = client.scatter([obj], broadcast=True)[0]
+    return futures
+
+
+def _attach_files(handles):
+    for name, (kind, path) in handles.items():
+        if _attached_files.get(name) == path:
+            continue
+        if kind == 'npy':
+            import numpy
+            _attached[name] = numpy.load(path, mmap_mode='r')
+        else:
+            with open(path, 'rb') as f:
+                _attached[name] = pickle.load(f)
+        _attached_files[name] = path
+
+
+class SharedFilesFunc(object):
+    """
+    Wraps func so that the shared objects in the files are attached
+    to the process running it, before it's called.
+    """
+    def __init__(self, func, handles):
+        self.func = func
+        self.handles = handles
+
+    def __call__(self, *args):
+        _attach_files(self.handles)
+        return self.func(*args)
+
+
+def call_with_scattered(*args, **kwargs):
+    """
+    Call kwargs['task_func'] with args on a dask worker, where the scattered
+    futures in kwargs['shared_objects'] were already replaced by the shared objects.
+    """
+    _attached.update(kwargs['shared_objects'])
+    return kwargs['task_func'](*args)
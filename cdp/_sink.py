@@ -0,0 +1,150 @@
+from __future__ import print_function
+
+import os
+import pickle
+import struct
+from cdp._fingerprint import fingerprint
+from cdp._checkpoint import CheckpointStore
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, where only one process should write to the file.
+    fcntl = None
+
+try:
+    from collections.abc import Sequence
+except ImportError:
+    from collections import Sequence
+
+# Each record is its length, then a pickled (fingerprint, result) tuple.
+_HEADER = struct.Struct('>Q')
+
+
+class AppendFileStore(object):
+    """
+    Results stored one after another in a single append-only file,
+    keyed by the fingerprint of the parameter used to create each one.
+    """
+    def __init__(self, path):
+        # Workers can have another working directory than the driver.
+        self.path = os.path.abspath(path)
+        self._offsets = {}
+        self._scanned = 0
+        if os.path.exists(self.path):
+            self._scan(truncate=True)
+
+    def __getstate__(self):
+        # The workers only append, so they don't need the index.
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.path = state['path']
+        self._offsets = {}
+        self._scanned = 0
+
+    def _scan(self, truncate=False):
+        """
+        Add the records written since the last scan to the index. A record
+        that's cut off, from a crash while writing it, is removed if truncate is True.
+        """
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb+' if truncate else 'rb') as f:
+            f.seek(self._scanned)
+            while True:
+                offset = f.tell()
+                header = f.read(_HEADER.size)
+                if len(header) < _HEADER.size:
+                    break
+                length = _HEADER.unpack(header)[0]
+                blob = f.read(length)
+                if len(blob) < length:
+                    break
+                key, _ = pickle.loads(blob)
+                self._offsets[key] = offset
+                self._scanned = f.tell()
+            if truncate:
+                f.truncate(self._scanned)
+
+    def __contains__(self, parameter):
+        key = fingerprint(parameter)
+        if key not in self._offsets:
+            self._scan()
+        return key in self._offsets
+
+    def load(self, parameter):
+        key = fingerprint(parameter)
+        if key not in self._offsets:
+            self._scan()
+        with open(self.path, 'rb') as f:
+            f.seek(self._offsets[key])
+            length = _HEADER.unpack(f.read(_HEADER.size))[0]
+            return pickle.loads(f.read(length))[1]
+
+    def save(self, parameter, result):
+        blob = pickle.dumps((fingerprint(parameter), result), pickle.HIGHEST_PROTOCOL)
+        with open(self.path, 'ab') as f:
+            # Lock the file so records from different processes don't get mixed together.
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.write(_HEADER.pack(len(blob)) + blob)
+                f.flush()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def as_store(sink):
+    """
+    Return the store for sink, which is either a store or the path to a directory.
+    """
+    if isinstance(sink, (CheckpointStore, AppendFileStore)):
+        return sink
+    return CheckpointStore(sink)
+
+
+class SinkFunc(object):
+    """
+    Wraps func so that its result is saved in the store and not returned.
+    """
+    def __init__(self, func, store):
+        self.func = func
+        self.store = store
+
+    def __call__(self, parameter):
+        self.store.save(parameter, self.func(parameter))
+
+
+class StoredResults(Sequence):
+    """
+    The results of a run in a store, in the order of the parameters.
+    Each result is only loaded when it's accessed.
+    """
+    def __init__(self, store, parameters, exceptions=None):
+        self.store = store
+        self.parameters = parameters
+        # The exceptions of the tasks that failed, by index.
+        self.exceptions = exceptions or {}
+
+    def __len__(self):
+        return len(self.parameters)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('StoredResults index out of range')
+        if i in self.exceptions:
+            return self.exceptions[i]
+        return self.store.load(self.parameters[i])
+
+    def without_exceptions(self):
+        """
+        Return the results of only the tasks that succeeded.
+        """
+        parameters = [p for i, p in enumerate(self.parameters) if i not in self.exceptions]
+        return StoredResults(self.store, parameters)
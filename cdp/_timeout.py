@@ -0,0 +1,88 @@
+from __future__ import print_function
+
+import time
+from dask.distributed import wait, TimeoutError as _WaitTimeoutError
+
+try:
+    _TimeoutBase = TimeoutError
+except NameError:
+    # TimeoutError isn't in Python 2.
+    _TimeoutBase = Exception
+
+
+class TaskTimeoutError(_TimeoutBase):
+    """
+    A task of distribute() didn't finish within its timeout.
+    """
+
+
+def _num_threads(client):
+    # Client.ncores() was renamed to Client.nthreads().
+    nthreads = getattr(client, 'nthreads', None) or client.ncores
+    return max(sum(nthreads().values()), 1)
+
+def run_with_timeout(client, submit, parameters, timeout, raise_errors):
+    """
+    Run each parameter with submit(parameter), which returns a future,
+    and return the results in order. A task that isn't done timeout seconds
+    after it was submitted is cancelled and gets a TaskTimeoutError.
+
+    Only as many tasks as the cluster has threads are submitted at once,
+    so each one starts about when it's submitted and the timeout is about
+    the time it ran. Dask can't stop a task that's running: a cancelled task
+    keeps running in its worker thread until it returns, and no other task
+    can use that thread until then. Tasks that wait for it are still timed
+    from when they were submitted.
+
+    If raise_errors is True, the first exception is raised and the rest of
+    the tasks are cancelled. Otherwise, it's put in place of the result.
+    """
+    window = _num_threads(client)
+    results = [None] * len(parameters)
+    todo = iter(enumerate(parameters))
+    # Each future to its index and deadline.
+    running = {}
+
+    def fill():
+        while len(running) < window:
+            try:
+                i, parameter = next(todo)
+            except StopIteration:
+                return
+            running[submit(parameter)] = (i, time.time() + timeout)
+
+    def fail(i, exception):
+        results[i] = exception
+        if raise_errors:
+            raise exception
+
+    try:
+        fill()
+        while running:
+            next_deadline = min(deadline for _, deadline in running.values())
+            try:
+                done = wait(list(running), timeout=max(next_deadline - time.time(), 0),
+                            return_when='FIRST_COMPLETED').done
+            except _WaitTimeoutError:
+                done = set()
+
+            for future in done:
+                i, _ = running.pop(future)
+                if future.status == 'error':
+                    fail(i, future.exception())
+                else:
+                    results[i] = future.result()
+
+            now = time.time()
+            for future, (i, deadline) in list(running.items()):
+                if deadline <= now:
+                    del running[future]
+                    client.cancel([future])
+                    fail(i, TaskTimeoutError(
+                        'Task took longer than {} seconds.'.format(timeout)))
+            fill()
+    except:
+        client.cancel(list(running))
+        raise
+
+    return results
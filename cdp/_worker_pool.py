@@ -0,0 +1,59 @@
+from __future__ import print_function
+
+import os
+import sys
+import importlib
+import multiprocessing
+
+
+def _preload(modules):
+    """
+    Import the modules in a worker process. A module can also be
+    the path to a .py file, like the one used with -p.
+    """
+    for module in modules:
+        if module.endswith('.py'):
+            path_to_module, module = os.path.split(os.path.abspath(module))
+            module = module[:-len('.py')]
+            if path_to_module not in sys.path:
+                sys.path.insert(0, path_to_module)
+        importlib.import_module(module)
+
+def _noop():
+    return os.getpid()
+
+def process_pool(num_workers, context=None, initializer=None, initargs=()):
+    """
+    Return a concurrent.futures.ProcessPoolExecutor with num_workers processes,
+    started with the multiprocessing start method context.
+    The mp_context and initializer options of it need Python 3.7 or later.
+    concurrent.futures is imported here, so cdp can be imported without it on Python 2.
+    """
+    if sys.version_info < (3, 7):
+        raise RuntimeError('This engine option needs Python 3.7 or later.')
+    import concurrent.futures
+
+    mp_context = multiprocessing.get_context(context)
+    return concurrent.futures.ProcessPoolExecutor(
+        num_workers, mp_context=mp_context,
+        initializer=initializer, initargs=initargs)
+
+
+class WorkerPool(object):
+    """
+    A pool of worker processes that's kept alive between calls to
+    cdp_run.multiprocess(), so the workers only start and import
+    the preload modules once.
+    """
+    def __init__(self, num_workers=None, context=None, preload=()):
+        self.num_workers = num_workers or multiprocessing.cpu_count()
+        self.executor = process_pool(self.num_workers, context,
+                                     initializer=_preload, initargs=(list(preload),))
+
+        # Start the workers now, instead of when the first tasks are submitted.
+        import concurrent.futures
+        futures = [self.executor.submit(_noop) for _ in range(self.num_workers)]
+        concurrent.futures.wait(futures)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
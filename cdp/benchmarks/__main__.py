@@ -0,0 +1,3 @@
+from cdp.benchmarks.run import main
+
+main()
@@ -0,0 +1,125 @@
+"""
+Time each of the cdp_run engines on the synthetic workloads and save the results as JSON.
+
+    python -m cdp.benchmarks --sizes 10 100 1000 --output results.json
+"""
+from __future__ import print_function
+
+import json
+import time
+import argparse
+import platform
+import multiprocessing
+import dask
+import distributed
+from dask.distributed import LocalCluster
+import cdp
+import cdp.cdp_run
+from cdp.benchmarks.workloads import WORKLOADS
+
+ENGINES = ['serial', 'threaded', 'multiprocess', 'distribute']
+
+
+def time_engine(engine, func, parameters, num_workers, scheduler_addr=None):
+    """
+    Return how many seconds it took to run func on the parameters with the engine.
+    """
+    start = time.time()
+    if engine == 'serial':
+        cdp.cdp_run.serial(func, parameters)
+    elif engine == 'threaded':
+        cdp.cdp_run.threaded(func, parameters, num_workers)
+    elif engine == 'multiprocess':
+        cdp.cdp_run.multiprocess(func, parameters, num_workers)
+    elif engine == 'distribute':
+        cdp.cdp_run.distribute(func, parameters, scheduler_addr)
+    return time.time() - start
+
+def run_benchmarks(engines, workloads, sizes, num_workers, repeat):
+    """
+    Return a list of the timings for each engine, workload and size.
+    The fastest of the repeated runs is kept.
+    """
+    results = []
+    cluster = None
+    if 'distribute' in engines:
+        cluster = LocalCluster(n_workers=1, threads_per_worker=num_workers,
+                               processes=False, dashboard_address=None)
+    try:
+        for workload in workloads:
+            func, make_parameters = WORKLOADS[workload]
+            for n in sizes:
+                parameters = make_parameters(n)
+                for engine in engines:
+                    addr = cluster.scheduler_address if cluster else None
+                    seconds = min(time_engine(engine, func, parameters, num_workers, addr)
+                                  for _ in range(repeat))
+                    print('{:>12} {:>14} {:>8}: {:.4f}s'.format(engine, workload, n, seconds))
+                    results.append({
+                        'engine': engine,
+                        'workload': workload,
+                        'n': n,
+                        'seconds': seconds,
+                        'seconds_per_task': seconds / n,
+                    })
+    finally:
+        cdp.cdp_run.close_clients()
+        if cluster is not None:
+            cluster.close()
+    return results
+
+def main(args=None):
+    parser = argparse.ArgumentParser('python -m cdp.benchmarks')
+    parser.add_argument(
+        '-e', '--engines',
+        nargs='+',
+        choices=ENGINES,
+        default=ENGINES,
+        help='The engines to benchmark.')
+    parser.add_argument(
+        '-w', '--workloads',
+        nargs='+',
+        choices=sorted(WORKLOADS),
+        default=sorted(WORKLOADS),
+        help='The workloads to run.')
+    parser.add_argument(
+        '-s', '--sizes',
+        type=int,
+        nargs='+',
+        default=[10, 100, 1000],
+        help='The numbers of parameters to run each workload with, up to 100000.')
+    parser.add_argument(
+        '-n', '--num_workers',
+        type=int,
+        default=multiprocessing.cpu_count(),
+        help='Number of workers for the parallel engines.')
+    parser.add_argument(
+        '-r', '--repeat',
+        type=int,
+        default=1,
+        help='Number of times to run each benchmark, the fastest run is kept.')
+    parser.add_argument(
+        '-o', '--output',
+        default='cdp_benchmarks.json',
+        help='Path of the JSON file to save the results to.')
+    args = parser.parse_args(args)
+
+    results = run_benchmarks(args.engines, args.workloads, args.sizes,
+                             args.num_workers, args.repeat)
+
+    output = {
+        'cdp_version': cdp.__version__,
+        'python_version': platform.python_version(),
+        'dask_version': dask.__version__,
+        'distributed_version': distributed.__version__,
+        'platform': platform.platform(),
+        'cpu_count': multiprocessing.cpu_count(),
+        'num_workers': args.num_workers,
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=2)
+    print('Saved the benchmark results to: {}'.format(args.output))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Synthetic workloads for benchmarking the cdp_run engines.
+Each one is a function that's run on a parameter and a function that creates the parameters.
+"""
+from __future__ import print_function
+
+import time
+import random
+from cdp.cdp_parameter import CDPParameter
+
+
+class BenchmarkParameter(CDPParameter):
+    def __init__(self, index, seconds=0.0, size=0):
+        self.index = index
+        self.seconds = seconds
+        self.size = size
+
+
+def tiny_cpu(parameter):
+    """
+    A task that does almost nothing, so the overhead of the engine dominates.
+    """
+    return sum(i * i for i in range(100)) + parameter.index
+
+def large_result(parameter):
+    """
+    A task that returns a large result, like a regridded field.
+    """
+    try:
+        import numpy
+        return numpy.ones(parameter.size // 8)
+    except ImportError:
+        return bytearray(parameter.size)
+
+def io_sleep(parameter):
+    """
+    A task that waits without using the CPU, like when it reads a file.
+    """
+    time.sleep(parameter.seconds)
+    return parameter.index
+
+def skewed(parameter):
+    """
+    A task that uses the CPU for a time that's different for each parameter.
+    """
+    end = time.time() + parameter.seconds
+    while time.time() < end:
+        pass
+    return parameter.index
+
+
+# The most memory the results of large_result use in total, so
+# the engines don't run out of memory when they gather them.
+LARGE_RESULT_TOTAL_BYTES = 256 * 1024 * 1024
+
+def _large_result_parameters(n):
+    # Each result is 8MB, but smaller when there are many, down to 1KB.
+    size = max(1024, min(8 * 1024 * 1024, LARGE_RESULT_TOTAL_BYTES // n))
+    return [BenchmarkParameter(i, size=size) for i in range(n)]
+
+def _skewed_parameters(n):
+    # A few of the tasks take much longer than the rest, with the same ones every run.
+    rng = random.Random(0)
+    return [BenchmarkParameter(i, seconds=min(0.001 * rng.paretovariate(1.5), 0.1))
+            for i in range(n)]
+
+WORKLOADS = {
+    'tiny_cpu': (tiny_cpu, lambda n: [BenchmarkParameter(i) for i in range(n)]),
+    'large_result': (large_result, _large_result_parameters),
+    'io_sleep': (io_sleep, lambda n: [BenchmarkParameter(i, seconds=0.001) for i in range(n)]),
+    'skewed': (skewed, _skewed_parameters),
+}
@@ -14,8 +14,9 @@ class CDPParameter(object):
         """
         Deepcopy any attribute of `other` into self.
         """
-        # First make a deepcopy of the current object.
-        duplicate = copy.deepcopy(self)
+        # First make a copy of the current object. Only the
+        # attributes from other are deepcopied, like in granulate().
+        duplicate = self.copy_on_write()
         
         for attr in dir(other):
             # Ignore any of the hidden attributes.
@@ -28,6 +29,21 @@ class CDPParameter(object):
         
         return duplicate
 
+    def copy_on_write(self):
+        """
+        Return a copy of this object with its own attributes, but with the
+        same values, so it takes time proportional to the number of attributes
+        and none of the values are copied. Setting or deleting an attribute of
+        either object doesn't change the other one, which is how granulate()
+        and __add__() change their copies, with a deepcopy of just the new values.
+        Changing a value in place, like appending to a list, changes it in both.
+        Pickling the copy, like the process and distributed engines do,
+        pickles its values along with it.
+        """
+        duplicate = copy.copy(self)
+        duplicate.__dict__ = dict(vars(self))
+        return duplicate
+
     def check_values(self):
         """
         Check that all of the variables in
@@ -35,6 +51,15 @@ class CDPParameter(object):
         """
         pass
 
+    def estimate_memory(self):
+        """
+        Return how much memory running with this parameter is expected to use,
+        either in bytes or as a string like '10GB'. This is used by
+        cdp_run.multiprocess() when it's given a memory_limit.
+        None means that it's unknown and is treated as 0.
+        """
+        return None
+
     def load_parameter_from_py(self, parameter_file_path):
         """
         Initialize a parameter object from a Python script.
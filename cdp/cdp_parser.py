@@ -5,12 +5,17 @@ import argparse
 import json
 import yaml
 import warnings
-import itertools
 import collections
 import copy
-import random
 import hashlib
 import types
+import bisect
+from cdp._parse_cache import parse_cache
+
+try:
+    from collections.abc import Iterable, Sequence
+except ImportError:
+    from collections import Iterable, Sequence
 
 if sys.version_info[0] >= 3:
     import configparser
@@ -30,6 +35,9 @@ class CDPParser(argparse.ArgumentParser):
                                         *args, **kwargs)
         self.load_default_args(default_args_file)
         self.__args_namespace = None
+        self.__explicit_dests = None
+        # The parameters loaded from -p and the command line, which are copied when used.
+        self.__loaded_parameters = {}
         self.__parameter_cls = parameter_cls
         
         if not self.__parameter_cls:
@@ -43,8 +51,19 @@ class CDPParser(argparse.ArgumentParser):
         This is because the command used is not always sys.argv.
         """
         self.cmd_used = sys.argv if not args else args
+        self.__explicit_dests = None
+        self.__loaded_parameters = {}
         return super(CDPParser, self).parse_args(args, namespace)
 
+    def add_argument(self, *args, **kwargs):
+        """
+        Overwrites default ArgumentParser.add_argument().
+        A new argument can change which dests were explicitly used.
+        """
+        self.__explicit_dests = None
+        self.__loaded_parameters = {}
+        return super(CDPParser, self).add_argument(*args, **kwargs)
+
     def view_args(self):
         """"
         Returns the args namespace.
@@ -52,29 +71,43 @@ class CDPParser(argparse.ArgumentParser):
         self._parse_arguments()
         return self.__args_namespace
 
+    def _cmd_used_tokens(self):
+        """
+        Returns a set of everything in the command used to run the script.
+        """
+        # self.cmd_used is like: ['something.py', '-p', 'test.py', '--s1', 'something']
+        # Sometimes, a command is run with '=': 'driver.py --something=this'
+        return set(c for cmd in self.cmd_used for c in cmd.split('='))
+
     def _was_command_used(self, cmdline_arg):
         """
         Returns True if the cmdline_arg was used to
         run the script that has this parser.
         """
-        # self.cmd_used is like: ['something.py', '-p', 'test.py', '--s1', 'something']
-        for cmd in self.cmd_used:
-            # Sometimes, a command is run with '=': 'driver.py --something=this'
-            for c in cmd.split('='):
-                if cmdline_arg == c:
-                    return True
-        return False
+        return cmdline_arg in self._cmd_used_tokens()
+
+    def _explicitly_used_dests(self):
+        """
+        Returns the set of dests of the args that were used in the command.
+        This is computed once per parse, since it's needed for every arg.
+        """
+        # Argument groups add actions without calling self.add_argument(),
+        # and cmd_used can be set directly.
+        key = (len(self._actions), tuple(self.cmd_used))
+        if self.__explicit_dests is None or self.__explicit_dests[0] != key:
+            tokens = self._cmd_used_tokens()
+            # Each cmdline_arg is either '-*' or '--*'.
+            dests = set(action.dest for cmdline_arg, action in self._option_string_actions.items()
+                        if cmdline_arg in tokens)
+            self.__explicit_dests = (key, dests)
+        return self.__explicit_dests[1]
 
     def _is_arg_default_value(self, arg):
         """
         Look at the command used for this parser (ex: test.py -s something --s1 something1)
         and if arg wasn't used, then it's a default value.
         """
-        # Each cmdline_arg is either '-*' or '--*'.
-        for cmdline_arg in self._option_string_actions:
-            if arg == self._option_string_actions[cmdline_arg].dest and self._was_command_used(cmdline_arg):
-                return False
-        return True
+        return arg not in self._explicitly_used_dests()
 
     @staticmethod
     def check_values_of_params(parameters):
@@ -110,14 +143,20 @@ class CDPParser(argparse.ArgumentParser):
         if not self.__args_namespace.parameters:
             return None
 
-        parameter = self.__parameter_cls()
+        # Only run the -p file once, and give a copy of it each time.
+        key = ('orig', self.__args_namespace.parameters)
+        if key not in self.__loaded_parameters:
+            parameter = self.__parameter_cls()
 
-        # Remove all of the variables.
-        parameter.__dict__.clear()
+            # Remove all of the variables.
+            parameter.__dict__.clear()
 
-        # if self.__args_namespace.parameters is not None:
-        parameter.load_parameter_from_py(
-            self.__args_namespace.parameters)
+            # if self.__args_namespace.parameters is not None:
+            parameter.load_parameter_from_py(
+                self.__args_namespace.parameters)
+            self.__loaded_parameters[key] = parameter
+
+        parameter = self._copy_parameter(self.__loaded_parameters[key])
 
         if check_values:
             parameter.check_values()
@@ -126,59 +165,87 @@ class CDPParser(argparse.ArgumentParser):
 
         return parameter
 
+    @staticmethod
+    def _copy_parameter(parameter):
+        """
+        Return a shallow copy of parameter, so setting or deleting attributes
+        of the copy doesn't change parameter. The values are still shared,
+        like they are between the parameters that combine_params() creates.
+        """
+        duplicate = copy.copy(parameter)
+        duplicate.__dict__ = dict(vars(parameter))
+        return duplicate
+
     def get_parameters_from_json(self, json_file, check_values=False, argparse_vals_only=True):
         """
         Given a json file, return the parameters from it.
         """
-        with open(json_file) as f:
-            json_data = json.loads(f.read())
-
         parameters = []
-        for key in json_data:
-            for single_run in json_data[key]:
-                p = self.__parameter_cls()
+        for single_run in parse_cache.get(json_file, 'json', self._parse_json):
+            p = self.__parameter_cls()
 
-                # Remove all of the variables.
-                p.__dict__.clear()
+            # Remove all of the variables.
+            p.__dict__.clear()
 
-                for attr_name in single_run:
-                    setattr(p, attr_name, single_run[attr_name])
+            for attr_name, attr_value in single_run:
+                setattr(p, attr_name, attr_value)
 
-                if check_values:
-                    p.check_values()
-                if argparse_vals_only:
-                    self._only_cmdline_args(p)
+            if check_values:
+                p.check_values()
+            if argparse_vals_only:
+                self._only_cmdline_args(p)
 
-                parameters.append(p)
+            parameters.append(p)
 
         return parameters
 
+    def _parse_json(self, json_file):
+        """
+        Return a list of the runs in the json file,
+        each a list of (name, value) for the attributes in it.
+        """
+        with open(json_file) as f:
+            json_data = json.loads(f.read())
+
+        runs = []
+        for key in json_data:
+            for single_run in json_data[key]:
+                runs.append([(attr_name, single_run[attr_name]) for attr_name in single_run])
+        return runs
+
     def _create_cfg_hash_titles(self, cfg_file):
         """
         Given a path to a cfg file, for any title '[#]', create a hash of it's contents
-        and change the title to that. Then return the StringIO object.
-        """
-        lines = []
+        and its position among the '[#]' titles, and change the title to that.
+        The same file always gets the same titles, even for sections with the same contents.
+        The lines are yielded as the file is read, so only one '[#]' section is kept in memory.
+        """
+        def hashed_section(section, ordinal):
+            h_sha256 = hashlib.sha256()
+            h_sha256.update('{}\n'.format(ordinal).encode())
+            h_sha256.update(''.join(section).encode())
+            return ['[{}]\n'.format(h_sha256.hexdigest())] + section
+
+        ordinal = 0
+        section = None  # The lines of the current '[#]' section.
         with open(cfg_file) as f:
-            lines = f.readlines()
+            for line in f:
+                if section is not None and line.startswith('['):
+                    for l in hashed_section(section, ordinal):
+                        yield l
+                    section = None
+                    ordinal += 1
+
+                if line in ['[#]\n', '[#]']:
+                    section = []
+                elif section is not None:
+                    section.append(line)
+                else:
+                    yield line
 
-        h_sha256 = hashlib.sha256()
-        i = 0
-        
-        while i < len(lines):
-            if lines[i] in ['[#]\n', '[#]']:
-                replace_idx = i
-                str_list = []
-                i += 1
-                while i < len(lines) and not lines[i].startswith('['):
-                    str_list.append(lines[i])
-                    i += 1
-                str_list.append(str(random.random()))  # Randomize the hash even more.
-                h_sha256.update(''.join(str_list).encode())
-                lines[replace_idx] = '[{}]'.format(h_sha256.hexdigest())
-            else:
-                i += 1
-        return StringIO('\n'.join(lines))
+        if section is not None:
+            for l in hashed_section(section, ordinal):
+                yield l
 
     def get_parameters_from_cfg(self, cfg_file, check_values=False, argparse_vals_only=True):
         """
@@ -186,19 +253,13 @@ class CDPParser(argparse.ArgumentParser):
         """
         parameters = []
 
-        cfg_file_obj = self._create_cfg_hash_titles(cfg_file)
-        kwargs = {'strict': False} if sys.version_info[0] >= 3 else {}  # 'strict' keyword doesn't work in Python 2.
-        config = configparser.ConfigParser(**kwargs)  # Allow for two lines to be the same.
-        config.readfp(cfg_file_obj)
-
-        for section in config.sections():
+        for section in parse_cache.get(cfg_file, 'cfg', self._parse_cfg):
             p = self.__parameter_cls()
 
             # Remove all of the variables.
             p.__dict__.clear()
 
-            for k, v in config.items(section):
-                v = yaml.safe_load(v)
+            for k, v in section:
                 setattr(p, k, v)
 
             if check_values:
@@ -210,6 +271,25 @@ class CDPParser(argparse.ArgumentParser):
 
         return parameters
 
+    def _parse_cfg(self, cfg_file):
+        """
+        Return a list of the sections in the cfg file,
+        each a list of (name, value) for the options in it.
+        """
+        lines = self._create_cfg_hash_titles(cfg_file)
+        if sys.version_info[0] >= 3:
+            config = configparser.ConfigParser(strict=False)  # Allow for two lines to be the same.
+            config.read_file(lines, source=cfg_file)
+        else:
+            # 'strict' keyword and read_file() don't exist in Python 2.
+            config = configparser.ConfigParser()
+            config.readfp(StringIO(''.join(lines)))
+
+        sections = []
+        for section in config.sections():
+            sections.append([(k, yaml.safe_load(v)) for k, v in config.items(section)])
+        return sections
+
     def get_other_parameters(self, files_to_open=[], check_values=False, argparse_vals_only=True):
         """
         Returns the parameters created by -d. If files_to_open is defined, 
@@ -263,12 +343,18 @@ class CDPParser(argparse.ArgumentParser):
         if not self._were_cmdline_args_used():
             return None 
 
-        parameter = self.__parameter_cls()
+        # Argument groups add actions without calling self.add_argument().
+        key = ('cmdline', len(self._actions))
+        if key not in self.__loaded_parameters:
+            parameter = self.__parameter_cls()
+
+            # Remove all of the variables
+            parameter.__dict__.clear()
 
-        # Remove all of the variables
-        parameter.__dict__.clear()
+            self._overwrite_parameters_with_cmdline_args(parameter)
+            self.__loaded_parameters[key] = parameter
 
-        self._overwrite_parameters_with_cmdline_args(parameter)
+        parameter = self._copy_parameter(self.__loaded_parameters[key])
 
         if check_values:
             parameter.check_values()
@@ -377,87 +463,80 @@ class CDPParser(argparse.ArgumentParser):
         print('Depreciation warning: please use combine_params() instead')
         self.combine_params(None, orig_parameters, other_parameters)
 
-    def granulate(self, parameters):
+    def granulate(self, parameters, lazy=False, main_parameters=None):
         """
         Given a list of parameters objects, for each parameters with a `granulate` attribute,
         create multiple parameters objects for each result in the Cartesian product of `granulate`.
-        """
-        final_parameters = []
-        for param in parameters:
-            if not hasattr(param, 'granulate') or (hasattr(param, 'granulate') and not param.granulate):
-                final_parameters.append(param)
-                continue
-
-            # Remove any attrs that are modules from the param object.
-            # These cause an error when copy.deepcopy(param) is used.
-            attrs = vars(param).items()
-            modules_in_param = []
-            for var_name, var_value in attrs:
-                if isinstance(var_value, types.ModuleType):
-                    modules_in_param.append(var_name)
-            for module in modules_in_param:
-                delattr(param, module)
-
-            # Granulate param.
-            vars_to_granulate = param.granulate  # Ex: ['seasons', 'plevs']
-            # Check that all of the vars_to_granulate are iterables.
-            # Ex: {'season': ['ANN', 'DJF', 'MAM'], 'plevs': [850.0, 250.0]}
-            vals_to_granulate = collections.OrderedDict()
-            for v in vars_to_granulate:
-                if not hasattr(param, v):
-                    raise RuntimeError("Parameters object has no attribute '{}' to granulate.".format(v))
-                param_v = getattr(param, v)
-                if not isinstance(param_v, collections.Iterable):
-                    raise RuntimeError("Granulate option '{}' is not an iterable.".format(v))
-                if param_v:  # Ignore [].
-                    vals_to_granulate[v] = param_v
-
-            # Ex: [('ANN', 850.0), ('ANN', 250.0), ('DJF', 850.0), ('DJF', 250.0), ...]
-            granulate_values = list(itertools.product(*vals_to_granulate.values()))
-            for g_vals in granulate_values:
-                p = copy.deepcopy(param)
-                for i, g_val in enumerate(g_vals):
-                    key_at_index_i = list(vals_to_granulate.keys())[i]
-                    # Make sure to insert a list with one element,
-                    # which is why we have [g_val].
-                    setattr(p, key_at_index_i, [g_val])
-                final_parameters.append(p)
-
-        return final_parameters
+        If lazy is True, a GranulatedParameters is returned, which only creates
+        each parameters object when it's accessed.
+        If main_parameters is given, only the parameters objects that
+        select(main_parameters, ...) would keep are created.
+        """
+        selected_values = None
+        if main_parameters:
+            selectors = self._get_selectors(None, main_parameters, parameters)
+            selected_values = self._get_selected_values(main_parameters, selectors)
+        granulated = GranulatedParameters(parameters, selected_values)
+        return granulated if lazy else list(granulated)
+
+    def _get_selected_values(self, main_parameters, selectors):
+        """
+        For each of the selectors, get the values of it in main_parameters.
+        These are sets, or lists when they have unhashable values.
+        """
+        selected_values = {}
+        for select_parameter in selectors:
+            value = _as_list(getattr(main_parameters, select_parameter))
+            try:
+                selected_values[select_parameter] = set(value)
+            except TypeError:
+                selected_values[select_parameter] = value
+        return selected_values
 
     def select(self, main_parameters, parameters):
         """
         Given a list of parameters (parameters), only return those from this list
         whose 'selector' parameters are a subset of the 'selector' parameters of main_parameters.        
         """
-        def is_subset(param1, param2):
-            """
-            Check if param1 is a subset of param2.
-            These are any Python objects.
-            """
-            if not isinstance(param1, list):
-                param1 = [param1]
-            if not isinstance(param2, list):
-                param2 = [param2]
-
-            return set(param1).issubset(set(param2))
-
         # Can't select from None.
         if not main_parameters:
-            return parameters
+            return list(parameters)
         
+        # Each parameter of a GranulatedParameters is created when it's accessed,
+        # so they're all kept to only create each of them once.
+        parameters = list(parameters)
         selectors = self._get_selectors(None, main_parameters, parameters)
-
-        final_parameters = []
-
-        for param in parameters:
-            if all(is_subset(getattr(param, select_parameter),
-                             getattr(main_parameters, select_parameter))
-                   for select_parameter in selectors):
-                       final_parameters.append(param)
-
-        return final_parameters
-    
+        selected_values = self._get_selected_values(main_parameters, selectors)
+
+        # For each selector, an inverted index of the values of the parameters
+        # to the indices of the parameters with those values.
+        # Parameters with unhashable values are kept separately.
+        index = {s: collections.defaultdict(list) for s in selectors}
+        unhashable = {s: [] for s in selectors}
+        for i, param in enumerate(parameters):
+            for select_parameter in selectors:
+                value = _as_list(getattr(param, select_parameter))
+                try:
+                    index[select_parameter][frozenset(value)].append(i)
+                except TypeError:
+                    unhashable[select_parameter].append((i, value))
+
+        # Each distinct set of values is only checked once per selector.
+        selected = None
+        for select_parameter in selectors:
+            allowed = selected_values[select_parameter]
+            indices = set()
+            for value, value_indices in index[select_parameter].items():
+                if _is_subset(value, allowed):
+                    indices.update(value_indices)
+            for i, value in unhashable[select_parameter]:
+                if _is_subset(value, allowed):
+                    indices.add(i)
+            selected = indices if selected is None else selected & indices
+
+        if selected is None:
+            return list(parameters)
+        return [parameters[i] for i in sorted(selected)]
 
     def _get_alias(self, param):
         """
@@ -529,8 +608,6 @@ class CDPParser(argparse.ArgumentParser):
             p = self.__parameter_cls()
             final_parameters = [p]
 
-        final_parameters = self.granulate(final_parameters)
-
         # Only select from the -p or the command line options.
         parameter = self.get_orig_parameters(*args, **kwargs)
         cmdline_parameter = self.get_cmdline_parameters(*args, **kwargs)
@@ -541,6 +618,8 @@ class CDPParser(argparse.ArgumentParser):
         # Sometimes, one of these can be None, so get the one that's None.
         parameter = parameter if parameter else cmdline_parameter
 
+        # Only create the granulated parameters that can be selected.
+        final_parameters = self.granulate(final_parameters, lazy=True, main_parameters=parameter)
         final_parameters = self.select(parameter, final_parameters)
         self.add_aliases(final_parameters)
 
@@ -680,3 +759,136 @@ class CDPParser(argparse.ArgumentParser):
         were inputted from the command line.
         """
         self.__args_namespace = self.parse_args(arg_list)
+
+
+def _as_list(param):
+    return param if isinstance(param, list) else [param]
+
+
+def _is_subset(param1, param2):
+    """
+    Check if param1 is a subset of param2.
+    These are any Python objects.
+    param2 is a set, or a list when it has unhashable values.
+    """
+    for p in param1:
+        try:
+            if p not in param2:
+                return False
+        except TypeError:  # Unhashable, so it can't be in a set.
+            return False
+    return True
+
+
+class GranulatedParameters(Sequence):
+    """
+    The parameters created by CDPParser.granulate(), in the same order.
+    Each one is created from its original parameters object when it's accessed,
+    so the Cartesian product of `granulate` is never stored all at once.
+    selected_values is from CDPParser._get_selected_values(). When it's given,
+    the combinations that CDPParser.select() wouldn't keep aren't included.
+    """
+    def __init__(self, parameters, selected_values=None):
+        # For each of the parameters, a tuple of (param, names, values), where
+        # names and values are the attributes to granulate and their values.
+        # names is None for parameters that aren't granulated.
+        self._groups = []
+        # The index of the first parameter created from each group.
+        self._starts = []
+        self._len = 0
+
+        for param in parameters:
+            if not hasattr(param, 'granulate') or (hasattr(param, 'granulate') and not param.granulate):
+                self._add_group(param, None, None, 1)
+                continue
+
+            # Remove any attrs that are modules from the param object.
+            # These cause an error when copy.deepcopy(param) is used.
+            attrs = vars(param).items()
+            modules_in_param = []
+            for var_name, var_value in attrs:
+                if isinstance(var_value, types.ModuleType):
+                    modules_in_param.append(var_name)
+            for module in modules_in_param:
+                delattr(param, module)
+
+            # Granulate param.
+            vars_to_granulate = param.granulate  # Ex: ['seasons', 'plevs']
+            # Check that all of the vars_to_granulate are iterables.
+            # Ex: {'season': ['ANN', 'DJF', 'MAM'], 'plevs': [850.0, 250.0]}
+            vals_to_granulate = collections.OrderedDict()
+            for v in vars_to_granulate:
+                if not hasattr(param, v):
+                    raise RuntimeError("Parameters object has no attribute '{}' to granulate.".format(v))
+                param_v = getattr(param, v)
+                if not isinstance(param_v, Iterable):
+                    raise RuntimeError("Granulate option '{}' is not an iterable.".format(v))
+                if param_v:  # Ignore [].
+                    vals_to_granulate[v] = list(param_v)
+
+            if selected_values:
+                self._select_values(param, vals_to_granulate, selected_values)
+
+            names = list(vals_to_granulate.keys())
+            values = list(vals_to_granulate.values())
+            n = 1
+            for vals in values:
+                n *= len(vals)
+            self._add_group(param, names, values, n)
+
+    def _select_values(self, param, vals_to_granulate, selected_values):
+        """
+        Remove the values in vals_to_granulate that aren't in selected_values.
+        If a selector that isn't granulated doesn't match, remove them all.
+        """
+        for select_parameter, allowed in selected_values.items():
+            if select_parameter in vals_to_granulate:
+                # Each value is used as [value].
+                vals_to_granulate[select_parameter] = [
+                    v for v in vals_to_granulate[select_parameter] if _is_subset([v], allowed)]
+            # If it's missing, leave it for select() to handle.
+            elif hasattr(param, select_parameter):
+                if not _is_subset(_as_list(getattr(param, select_parameter)), allowed):
+                    for v in vals_to_granulate:
+                        vals_to_granulate[v] = []
+                    return
+
+    def _add_group(self, param, names, values, n):
+        self._groups.append((param, names, values))
+        self._starts.append(self._len)
+        self._len += n
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('GranulatedParameters index out of range')
+
+        group = bisect.bisect_right(self._starts, i) - 1
+        param, names, values = self._groups[group]
+        if names is None:
+            return param
+
+        # Ex: [('ANN', 850.0), ('ANN', 250.0), ('DJF', 850.0), ('DJF', 250.0), ...]
+        # The last attribute changes the fastest, like in itertools.product().
+        offset = i - self._starts[group]
+        g_vals = []
+        for vals in reversed(values):
+            offset, j = divmod(offset, len(vals))
+            g_vals.append(vals[j])
+        g_vals.reverse()
+
+        if hasattr(param, 'copy_on_write'):
+            p = param.copy_on_write()
+        else:
+            p = copy.deepcopy(param)
+        for name, g_val in zip(names, g_vals):
+            # Make sure to insert a list with one element,
+            # which is why we have [g_val].
+            setattr(p, name, [copy.deepcopy(g_val)])
+        return p
@@ -1,65 +1,719 @@
 from __future__ import print_function
 
+import os
+import atexit
+import shutil
+import itertools
+import collections
+import multiprocessing
 import dask.bag
-from dask.distributed import Client
+from dask.distributed import Client, LocalCluster, as_completed, wait
+from cdp._fingerprint import fingerprint
+from cdp._checkpoint import CheckpointStore, CheckpointedFunc
+from cdp._runtime_history import RuntimeHistory, TimedFunc
+from cdp._instrument import InstrumentedFunc, RunReport, failed_record
+from cdp._admission import run_with_memory_limit, call_pickled
+from cdp._worker_pool import WorkerPool, process_pool
+from cdp._timeout import TaskTimeoutError, run_with_timeout
+from cdp._sink import AppendFileStore, SinkFunc, StoredResults, as_store
+from cdp import _dag
+from cdp import _shared
+from cdp import _array_transport
+from cdp._shared import share, shared, unshare
 
+try:
+    from collections.abc import Sequence
+except ImportError:
+    from collections import Sequence
 
-def serial(func, parameters):
+
+worker_pool = None
+
+def _as_sequence(parameters):
+    """
+    The engines that return a list of results need all of the parameters,
+    so iterators and generators are read into a list. Use imap() to stream them.
+    """
+    if isinstance(parameters, Sequence):
+        return parameters
+    return list(parameters)
+
+def start_worker_pool(num_workers=None, context=None, preload=()):
+    """
+    Start a pool of num_workers processes that's used by all of the later
+    calls to multiprocess(), until shutdown_worker_pool() is called.
+    Each worker imports the modules in preload when it starts, which can also
+    be paths to .py files. The pool is shut down when the interpreter exits.
+    This needs Python 3.7 or later.
+    """
+    global worker_pool
+    shutdown_worker_pool()
+    worker_pool = WorkerPool(num_workers, context, preload)
+    return worker_pool
+
+def shutdown_worker_pool():
+    """
+    Stop the workers of the pool started with start_worker_pool(), if any.
+    """
+    global worker_pool
+    if worker_pool is not None:
+        worker_pool.shutdown()
+        worker_pool = None
+
+atexit.register(shutdown_worker_pool)
+
+def _run_deduplicated(engine, func, parameters, *args, **kwargs):
+    """
+    Run the engine once for each of the parameters with unique attributes and
+    give the result to all of the ones that are the same, in the original order.
+    """
+    first_index = {}
+    unique_parameters = []
+    indices = []
+    for p in parameters:
+        key = fingerprint(p)
+        if key not in first_index:
+            first_index[key] = len(unique_parameters)
+            unique_parameters.append(p)
+        indices.append(first_index[key])
+
+    unique_results = engine(func, unique_parameters, *args, **kwargs)
+    return [unique_results[i] for i in indices]
+
+def _run_with_sink(engine, func, parameters, sink, *args, **kwargs):
+    """
+    Run the engine, saving each result to the sink as soon as it's computed
+    instead of returning it. Return a StoredResults that loads the results
+    from the sink when they're accessed.
+    """
+    store = as_store(sink)
+    checkpoint_dir = kwargs.pop('checkpoint_dir', None)
+    if checkpoint_dir and os.path.abspath(checkpoint_dir) == os.path.abspath(store.path):
+        raise RuntimeError('The sink and checkpoint_dir must be different.')
+
+    indices = list(range(len(parameters)))
+    if checkpoint_dir:
+        # The checkpoint is saved before the sink, so it has the result and not None.
+        # Results that were checkpointed in an earlier run are copied to the sink.
+        checkpoints = CheckpointStore(checkpoint_dir)
+        indices = []
+        for i, p in enumerate(parameters):
+            if p not in checkpoints:
+                indices.append(i)
+            elif p not in store:
+                store.save(p, checkpoints.load(p))
+        func = CheckpointedFunc(func, checkpoints)
+
+    missing = [parameters[i] for i in indices]
+    results = engine(SinkFunc(func, store), missing, *args, **kwargs) if missing else []
+    exceptions = dict((indices[j], r) for j, r in enumerate(results) if isinstance(r, Exception))
+    return StoredResults(store, parameters, exceptions)
+
+def _run_checkpointed(engine, func, parameters, checkpoint_dir, *args, **kwargs):
+    """
+    Run the engine with only the parameters that don't have a result
+    in checkpoint_dir, saving each result as soon as it's computed.
+    Then return the results of all of the parameters, in order.
+    """
+    store = CheckpointStore(checkpoint_dir)
+    is_missing = [p not in store for p in parameters]
+    missing = [p for p, m in zip(parameters, is_missing) if m]
+    new_results = iter(engine(CheckpointedFunc(func, store), missing, *args, **kwargs)
+                       if missing else [])
+    return [next(new_results) if m else store.load(p) for p, m in zip(parameters, is_missing)]
+
+def _run_longest_first(engine, func, parameters, runtime_history, *args, **kwargs):
+    """
+    Run the engine with the parameters ordered from the longest to the shortest
+    runtime in the runtime_history file, and then update the file with the new
+    runtimes. The results are returned in the original order of the parameters.
+    """
+    history = RuntimeHistory(runtime_history)
+    order = history.longest_first(parameters)
+
+    timed_results = engine(TimedFunc(func), [parameters[i] for i in order], *args, **kwargs)
+
+    results = [None] * len(parameters)
+    for i, timed_result in zip(order, timed_results):
+        if isinstance(timed_result, Exception):
+            # The task failed and distribute() was told to return the exceptions.
+            results[i] = timed_result
+            continue
+        results[i], seconds = timed_result
+        history.record(parameters[i], seconds)
+    history.save()
+
+    return results
+
+def _run_instrumented(engine, func, parameters, report, *args, **kwargs):
+    """
+    Run the engine and add a record of how each task ran to the report.
+    All of the tasks are run, and the first exception is raised at the end,
+    unless the engine was told to return the exceptions in the results.
+    """
+    return_exceptions = kwargs.get('errors') == 'return_exceptions'
+    if 'errors' in kwargs:
+        # Tasks that timed out don't have a record, so get their exceptions
+        # too, to add them to the report before raising.
+        kwargs['errors'] = 'return_exceptions'
+    instrumented_results = engine(InstrumentedFunc(func), parameters, *args, **kwargs)
+
+    results = []
+    exceptions = []
+    for parameter, instrumented_result in zip(parameters, instrumented_results):
+        if isinstance(instrumented_result, Exception):
+            instrumented_result = None, failed_record(parameter, instrumented_result), \
+                instrumented_result
+        result, record, exception = instrumented_result
+        report.add(record)
+        if exception is not None:
+            exceptions.append(exception)
+        results.append(exception if return_exceptions and exception is not None else result)
+
+    if exceptions and not return_exceptions:
+        raise exceptions[0]
+    return results
+
+def serial(func, parameters, checkpoint_dir=None, report=None, dedup=False, sink=None):
     """
     Run the function with the parameters serially.
+
+    If ``checkpoint_dir`` is defined, each result is saved there, and any
+    parameter that already has a result in it isn't run again.
+
+    If ``report`` is a ``RunReport``, the wall time, CPU time, peak memory,
+    host, pid and status of each task that's run is added to it.
+
+    If ``dedup`` is True, parameters with the same attributes are only run once
+    and the same result is returned for each of them.
+
+    If ``sink`` is the path to a directory or an ``AppendFileStore``, each result
+    is written to it as soon as it's computed, so the results don't all have to
+    fit in memory. A sequence that loads each result when it's accessed is returned.
+
+    These apply to all of the engines.
     """
+    parameters = _as_sequence(parameters)
+    if sink is not None:
+        return _run_with_sink(serial, func, parameters, sink, checkpoint_dir=checkpoint_dir,
+                              report=report, dedup=dedup)
+    if dedup:
+        return _run_deduplicated(serial, func, parameters, checkpoint_dir, report)
+    if checkpoint_dir:
+        return _run_checkpointed(serial, func, parameters, checkpoint_dir, report=report)
+    if report is not None:
+        return _run_instrumented(serial, func, parameters, report)
+
     results = []
     for p in parameters:
         results.append(func(p))
     return results
 
-def multiprocess(func, parameters, num_workers=None, context=None):
+def _compute(bag, parameters, num_workers=None):
+    """
+    Compute the bag with the currently configured dask scheduler,
+    using num_workers or the one from the parameters if it's defined.
+    """
+    if num_workers:
+        return bag.compute(num_workers=num_workers)
+    elif hasattr(parameters[0], 'num_workers'):
+        return bag.compute(num_workers=parameters[0].num_workers)
+    else:
+        # num of workers is defaulted to the number of logical processes
+        return bag.compute()
+
+def multiprocess(func, parameters, num_workers=None, context=None, checkpoint_dir=None,
+                 runtime_history=None, report=None, memory_limit=None, mmap_results=False,
+                 dedup=False, sink=None):
     """
     Run the function with the parameters in parallel using multiprocessing.
 
     ``context`` is one of ``{"fork", "spawn", "forkserver"}``.  For
     dask<2.16.0,the default context is "fork" and for dask>=2.16.0, the default
     is "spawn".
+
+    If ``runtime_history`` is a path to a file, the parameters that took the
+    longest in previous runs are submitted first and the runtimes of this run
+    are saved to it. This shortens the tail of runs with uneven runtimes.
+    The same applies to distribute().
+
+    If ``memory_limit`` is defined, like ``'200GB'``, a task is only started
+    when the sum of the ``estimate_memory()`` of the running parameters fits in it.
+    ``num_workers`` is still the most tasks that can run at once.
+    This needs Python 3.7 or later.
+
+    Objects registered with ``share()`` are written to a file once and
+    loaded by each worker process, with NumPy arrays being memory-mapped.
+
+    If ``mmap_results`` is True, large NumPy arrays in the results are written by
+    the workers to /dev/shm (or the temp directory) and memory-mapped in this
+    process, instead of being pickled back. It can also be the directory to use.
+
+    If a pool was started with ``start_worker_pool()``, its workers are used
+    and ``num_workers`` and ``context`` are ignored.
     """
+    parameters = _as_sequence(parameters)
+    if sink is not None:
+        return _run_with_sink(multiprocess, func, parameters, sink, num_workers, context,
+                              checkpoint_dir=checkpoint_dir, runtime_history=runtime_history,
+                              report=report, memory_limit=memory_limit, dedup=dedup)
+    if dedup:
+        return _run_deduplicated(multiprocess, func, parameters, num_workers, context,
+                                 checkpoint_dir, runtime_history, report, memory_limit,
+                                 mmap_results)
+    if checkpoint_dir:
+        return _run_checkpointed(multiprocess, func, parameters, checkpoint_dir,
+                                 num_workers, context, runtime_history=runtime_history,
+                                 report=report, memory_limit=memory_limit,
+                                 mmap_results=mmap_results)
+    if report is not None:
+        return _run_instrumented(multiprocess, func, parameters, report,
+                                 num_workers, context, runtime_history=runtime_history,
+                                 memory_limit=memory_limit, mmap_results=mmap_results)
+    if runtime_history:
+        return _run_longest_first(multiprocess, func, parameters, runtime_history,
+                                  num_workers, context, memory_limit=memory_limit,
+                                  mmap_results=mmap_results)
+    if mmap_results:
+        dir_name = _array_transport.result_dir(
+            mmap_results if mmap_results is not True else None)
+        try:
+            results = multiprocess(_array_transport.ArrayResultFunc(func, dir_name), parameters,
+                                   num_workers, context, memory_limit=memory_limit)
+        except:
+            shutil.rmtree(dir_name, True)
+            raise
+        return _array_transport.load_results(results, dir_name)
+
+    if context is None and hasattr(parameters[0], 'multiprocessing_context'):
+        context = parameters[0].multiprocessing_context
+
+    if _shared._registered:
+        func = _shared.SharedFilesFunc(func, _shared.file_handles())
+
+    if memory_limit and worker_pool is not None:
+        return run_with_memory_limit(func, parameters, memory_limit, worker_pool.num_workers,
+                                     None, worker_pool.executor)
+    elif memory_limit:
+        if not num_workers:
+            num_workers = getattr(parameters[0], 'num_workers', None) or multiprocessing.cpu_count()
+        if context is None:
+            context = dask.config.get('multiprocessing.context', 'spawn')
+        return run_with_memory_limit(func, parameters, memory_limit, num_workers, context)
+
     bag = dask.bag.from_sequence(parameters)
 
+    if worker_pool is not None:
+        with dask.config.set({'scheduler': 'processes'}):
+            return bag.map(func).compute(pool=worker_pool.executor)
+
     config = {'scheduler': 'processes'}
     if context is not None:
         config['multiprocessing.context'] = context
-    elif hasattr(parameters[0], 'multiprocessing_context'):
-        config['multiprocessing.context'] = \
-            parameters[0].multiprocessing_context
 
     with dask.config.set(config):
-        if num_workers:
-            results = bag.map(func).compute(num_workers=num_workers)
-        elif hasattr(parameters[0], 'num_workers'):
-            results = bag.map(func).compute(num_workers=parameters[0].num_workers)
-        else:
-            # num of workers is defaulted to the number of logical processes
-            results = bag.map(func).compute()
+        results = _compute(bag.map(func), parameters, num_workers)
+
+        return results
+
+def threaded(func, parameters, num_workers=None, checkpoint_dir=None, report=None,
+             dedup=False, sink=None):
+    """
+    Run the function with the parameters in parallel using a pool of threads.
+
+    This is useful when func spends most of its time in I/O or in code that
+    releases the GIL, since the parameters don't need to be pickled
+    and sent to other processes.
+    """
+    parameters = _as_sequence(parameters)
+    if sink is not None:
+        return _run_with_sink(threaded, func, parameters, sink, num_workers,
+                              checkpoint_dir=checkpoint_dir, report=report, dedup=dedup)
+    if dedup:
+        return _run_deduplicated(threaded, func, parameters, num_workers, checkpoint_dir,
+                                 report)
+    if checkpoint_dir:
+        return _run_checkpointed(threaded, func, parameters, checkpoint_dir,
+                                 num_workers, report=report)
+    if report is not None:
+        return _run_instrumented(threaded, func, parameters, report, num_workers)
+
+    bag = dask.bag.from_sequence(parameters)
+
+    with dask.config.set({'scheduler': 'threads'}):
+        results = _compute(bag.map(func), parameters, num_workers)
 
         return results
 
-def distribute(func, parameters, scheduler_addr=None):
+def _get_concurrency(first_parameter, concurrency=None):
+    if concurrency:
+        return concurrency
+    return getattr(first_parameter, 'num_workers', None)
+
+def async_run(coro_func, parameters, concurrency=None):
+    """
+    Run the coroutine function with the parameters concurrently on a single
+    event loop and return the results in the order of the parameters.
+
+    At most ``concurrency`` coroutines are run at once. It defaults to
+    the ``num_workers`` of the parameters, and there's no limit if neither is defined.
+    """
+    from cdp import _async
+    parameters = _as_sequence(parameters)
+    first_parameter = parameters[0] if parameters else None
+    return _async.run(coro_func, parameters, _get_concurrency(first_parameter, concurrency))
+
+def async_iter(coro_func, parameters, concurrency=None):
     """
-    Run the function with the parameters in parallel distributedly.
+    Like async_run(), but yield ``(parameter, result)`` pairs as the coroutines finish.
     """
+    from cdp import _async
+    parameters = iter(parameters)
     try:
-        if scheduler_addr:
-            addr = scheduler_addr
-        elif not hasattr(parameters[0], 'scheduler_addr'):
-            raise RuntimeError('The parameters or distribute() need a scheduler_addr parameter.')
+        first_parameter = next(parameters)
+    except StopIteration:
+        return iter([])
+    parameters = itertools.chain([first_parameter], parameters)
+    return _async.iterate(coro_func, parameters, _get_concurrency(first_parameter, concurrency))
+
+class ClientPool(object):
+    """
+    Keeps one dask Client per scheduler address, so that
+    repeated calls to distribute() reuse the same connection.
+    A LocalCluster is started in this process when a client
+    without a scheduler address is requested.
+    """
+    def __init__(self):
+        self._clients = {}
+        self._local_cluster = None
+
+    def get(self, scheduler_addr=None, **cluster_kwargs):
+        """
+        Return a running client connected to scheduler_addr.
+        If scheduler_addr is None, the client is connected to a local cluster,
+        which is created with cluster_kwargs the first time it's needed.
+        """
+        client = self._clients.get(scheduler_addr)
+        if client is not None and client.status == 'running':
+            return client
+
+        if scheduler_addr is None:
+            if self._local_cluster is None:
+                self._local_cluster = LocalCluster(**cluster_kwargs)
+            client = Client(self._local_cluster)
+        else:
+            client = Client(scheduler_addr)
+
+        self._clients[scheduler_addr] = client
+        return client
+
+    def close(self):
+        """
+        Close all of the clients and the local cluster, if any.
+        """
+        for addr in list(self._clients):
+            client = self._clients.pop(addr)
+            try:
+                client.close()
+            except Exception as e:
+                print('Failed to close the client for {}: {}'.format(addr, e))
+
+        if self._local_cluster is not None:
+            self._local_cluster.close()
+            self._local_cluster = None
+
+client_pool = ClientPool()
+atexit.register(client_pool.close)
+
+def close_clients():
+    """
+    Close all of the clients used by distribute() and distribute_iter().
+    This is done automatically when the interpreter exits.
+    """
+    client_pool.close()
+
+def _get_client(parameters, scheduler_addr=None, local_cluster=False):
+    """
+    Get a client for the scheduler address passed in, or the one from the parameters.
+    When the address is None, a local cluster is used.
+    """
+    if scheduler_addr:
+        addr = scheduler_addr
+    elif hasattr(parameters[0], 'scheduler_addr'):
+        addr = parameters[0].scheduler_addr
+    elif local_cluster:
+        addr = None
+    else:
+        raise RuntimeError('The parameters or distribute() need a scheduler_addr parameter.')
+
+    if addr is not None:
+        return client_pool.get(addr)
+
+    cluster_kwargs = {}
+    if getattr(parameters[0], 'num_workers', None):
+        cluster_kwargs['n_workers'] = parameters[0].num_workers
+    return client_pool.get(None, **cluster_kwargs)
+
+def _map(client, func, parameters, **kwargs):
+    """
+    Map func over the parameters with the client, passing
+    along the futures of any shared objects to the workers.
+    """
+    if not _shared._registered:
+        return client.map(func, parameters, **kwargs)
+    return client.map(_shared.call_with_scattered, parameters, task_func=func,
+                      shared_objects=_shared.scattered_futures(client), **kwargs)
+
+def _gather(client, futures, errors):
+    """
+    Gather the results of the futures. If errors is 'raise', the first exception
+    is raised and the rest of the futures are cancelled. Otherwise,
+    the exception of each failed task is in its place in the results.
+    """
+    if errors == 'raise':
+        try:
+            return client.gather(futures)
+        except:
+            client.cancel(futures)
+            raise
+
+    wait(futures)
+    return [f.exception() if f.status == 'error' else f.result() for f in futures]
+
+def distribute(func, parameters, scheduler_addr=None, local_cluster=False, checkpoint_dir=None,
+               runtime_history=None, report=None, dedup=False, timeout=None, errors='raise',
+               sink=None):
+    """
+    Run the function with the parameters in parallel distributedly
+    and return the results.
+
+    Clients are reused across calls with the same scheduler address.
+    If there's no scheduler address and ``local_cluster`` is True,
+    a ``LocalCluster`` is started in this process and used instead.
+
+    The results are saved to ``checkpoint_dir`` by the workers,
+    so it must be on a file system that they can access.
+
+    Objects registered with ``share()`` are scattered to all
+    of the workers once per client and reused across calls.
+
+    A task that runs for more than ``timeout`` seconds fails with a TaskTimeoutError,
+    which is a TimeoutError on Python 3. It's cancelled, but dask can't stop a task
+    that's already running, so it keeps using its worker thread until it returns.
+    With a timeout, only as many tasks as the cluster has threads are submitted at once.
+    ``errors`` is what's done when tasks fail:
+
+        * ``'raise'``: raise the first exception and cancel the remaining tasks.
+        * ``'skip'``: only return the results of the tasks that succeeded.
+        * ``'return_exceptions'``: return the exception in place of the result.
+
+    With the last two, the results of the tasks that succeeded are always returned.
+    """
+    if errors not in ['raise', 'skip', 'return_exceptions']:
+        raise RuntimeError('Invalid errors {}, use raise, skip or return_exceptions.'.format(errors))
+    if errors == 'skip':
+        results = distribute(func, parameters, scheduler_addr, local_cluster, checkpoint_dir,
+                             runtime_history, report, dedup, timeout, 'return_exceptions',
+                             sink)
+        if isinstance(results, StoredResults):
+            return results.without_exceptions()
+        return [r for r in results if not isinstance(r, Exception)]
+
+    parameters = _as_sequence(parameters)
+    if sink is not None:
+        return _run_with_sink(distribute, func, parameters, sink, scheduler_addr, local_cluster,
+                              checkpoint_dir=checkpoint_dir, runtime_history=runtime_history,
+                              report=report, dedup=dedup, timeout=timeout, errors=errors)
+    if dedup:
+        return _run_deduplicated(distribute, func, parameters, scheduler_addr, local_cluster,
+                                 checkpoint_dir, runtime_history, report, timeout=timeout,
+                                 errors=errors)
+    if checkpoint_dir:
+        return _run_checkpointed(distribute, func, parameters, checkpoint_dir,
+                                 scheduler_addr, local_cluster, runtime_history=runtime_history,
+                                 report=report, timeout=timeout, errors=errors)
+    if report is not None:
+        return _run_instrumented(distribute, func, parameters, report,
+                                 scheduler_addr, local_cluster, runtime_history=runtime_history,
+                                 timeout=timeout, errors=errors)
+    if runtime_history:
+        return _run_longest_first(distribute, func, parameters, runtime_history,
+                                  scheduler_addr, local_cluster, timeout=timeout, errors=errors)
+
+    try:
+        client = _get_client(parameters, scheduler_addr, local_cluster)
+        if timeout:
+            results = run_with_timeout(client, lambda p: _submit(client, func, p),
+                                       parameters, timeout, errors == 'raise')
         else:
-            addr = parameters[0].scheduler_addr
+            futures = _map(client, func, parameters)
+            results = _gather(client, futures, errors)
+    except Exception as e:
+        print('Distributed run failed.')
+        raise e
+
+    return results
+
+def distribute_iter(func, parameters, scheduler_addr=None, local_cluster=False):
+    """
+    Run the function with the parameters in parallel distributedly,
+    yielding ``(parameter, result)`` pairs in the order the tasks finish.
+
+    Each result is released from the cluster once it's been yielded,
+    so the client never holds all of the results at once.
+    """
+    try:
+        client = _get_client(parameters, scheduler_addr, local_cluster)
+        # pure=False so that equal parameters still get their own task.
+        futures = _map(client, func, parameters, pure=False)
+        params_for_futures = dict(zip(futures, parameters))
+        completed = as_completed(futures, with_results=True)
+        del futures
 
-        client = Client(addr)
-        results = client.map(func, parameters)
-        client.gather(results)
+        for future, result in completed:
+            parameter = params_for_futures.pop(future)
+            future.release()
+            yield parameter, result
     except Exception as e:
         print('Distributed run failed.')
         raise e
+
+def _submit(client, func, parameter):
+    """
+    Like _map(), but for a single parameter.
+    """
+    if not _shared._registered:
+        return client.submit(func, parameter, pure=False)
+    return client.submit(_shared.call_with_scattered, parameter, task_func=func,
+                         shared_objects=_shared.scattered_futures(client), pure=False)
+
+def _in_window(submit, parameters, window):
+    """
+    Call submit() on each parameter, with at most window of them running
+    at once, and yield the results in order as they're done.
+    """
+    in_flight = collections.deque()
+    try:
+        for p in parameters:
+            if len(in_flight) >= window:
+                yield in_flight.popleft().result()
+            in_flight.append(submit(p))
+        while in_flight:
+            yield in_flight.popleft().result()
     finally:
-        client.close()
+        # The caller stopped early or a task failed.
+        for future in in_flight:
+            future.cancel()
 
-    return results
+def _imap_processes(func, parameters, window, num_workers, context):
+    if _shared._registered:
+        func = _shared.SharedFilesFunc(func, _shared.file_handles())
+    import cloudpickle
+    pickled_func = cloudpickle.dumps(func)
+
+    if worker_pool is not None:
+        submit = lambda p: worker_pool.executor.submit(call_pickled, pickled_func, p)
+        for result in _in_window(submit, parameters, window):
+            yield result
+        return
+
+    with process_pool(num_workers, context) as pool:
+        submit = lambda p: pool.submit(call_pickled, pickled_func, p)
+        for result in _in_window(submit, parameters, window):
+            yield result
+
+def _imap_threads(func, parameters, window, num_workers):
+    import concurrent.futures
+    with concurrent.futures.ThreadPoolExecutor(num_workers) as pool:
+        for result in _in_window(lambda p: pool.submit(func, p), parameters, window):
+            yield result
+
+def imap(func, parameters, engine='serial', window=None, config=None, num_workers=None,
+         context=None, scheduler_addr=None, local_cluster=False):
+    """
+    Run the function with the parameters, which can be any iterable or generator,
+    and yield the results in order. At most ``window`` parameters are taken from
+    ``parameters`` ahead of the results that were yielded, so producing the
+    parameters, running them and using the results all happen with constant memory.
+
+    ``engine`` is one of ``{"serial", "threaded", "multiprocess", "distribute"}``
+    and the other arguments are the same as for those functions. The
+    ``num_workers``, ``multiprocessing_context`` and ``scheduler_addr`` are read
+    from ``config`` if it's given, and from the first parameter otherwise.
+    ``window`` defaults to twice the number of workers.
+    The "multiprocess" engine needs Python 3.7 or later.
+    """
+    parameters = iter(parameters)
+    if config is None:
+        try:
+            config = next(parameters)
+        except StopIteration:
+            return
+        parameters = itertools.chain([config], parameters)
+
+    if engine == 'serial':
+        for p in parameters:
+            yield func(p)
+        return
+
+    if engine == 'distribute':
+        client = _get_client([config], scheduler_addr, local_cluster)
+        num_workers = num_workers or sum(client.nthreads().values())
+        submit = lambda p: _submit(client, func, p)
+    else:
+        num_workers = num_workers or getattr(config, 'num_workers', None) or \
+            multiprocessing.cpu_count()
+    window = window or 2 * num_workers
+
+    if engine == 'distribute':
+        results = _in_window(submit, parameters, window)
+    elif engine == 'multiprocess':
+        if context is None:
+            context = getattr(config, 'multiprocessing_context', None) or \
+                dask.config.get('multiprocessing.context', 'spawn')
+        results = _imap_processes(func, parameters, window, num_workers, context)
+    elif engine == 'threaded':
+        results = _imap_threads(func, parameters, window, num_workers)
+    else:
+        raise RuntimeError('Invalid engine {}, use serial, threaded, multiprocess '
+                           'or distribute.'.format(engine))
+
+    for result in results:
+        yield result
+
+def dag(func, parameters, engine='serial', num_workers=None, context=None,
+        scheduler_addr=None, local_cluster=False):
+    """
+    Run the function with parameters that depend on the results of other
+    parameters, starting each one as soon as its dependencies are done.
+
+    The ``depends_on`` attribute of a parameter is a list of the parameters it
+    depends on, or of their ``name`` attribute. The function is called as
+    ``func(parameter, inputs)``, where ``inputs`` is the list of the results of
+    the ``depends_on`` parameters, in the same order.
+
+    ``engine`` is one of ``{"serial", "multiprocess", "distribute"}`` and
+    the other arguments are the same as for those functions.
+    The "multiprocess" engine needs Python 3.7 or later.
+    """
+    parameters = _as_sequence(parameters)
+    deps = _dag.dependencies(parameters)
+
+    if engine == 'serial':
+        return _dag.run_serial(func, parameters, deps)
+    elif engine == 'multiprocess':
+        if _shared._registered:
+            func = _shared.SharedFilesFunc(func, _shared.file_handles())
+        if worker_pool is not None:
+            return _dag.run_processes(func, parameters, deps, None, None, worker_pool.executor)
+        if not num_workers:
+            num_workers = getattr(parameters[0], 'num_workers', None) or multiprocessing.cpu_count()
+        if context is None:
+            context = getattr(parameters[0], 'multiprocessing_context', None) or \
+                dask.config.get('multiprocessing.context', 'spawn')
+        return _dag.run_processes(func, parameters, deps, num_workers, context)
+    elif engine == 'distribute':
+        client = _get_client(parameters, scheduler_addr, local_cluster)
+        shared_objects = _shared.scattered_futures(client) if _shared._registered else None
+        return _dag.run_distributed(client, func, parameters, deps, shared_objects)
+    raise RuntimeError('Invalid engine {}, use serial, multiprocess or distribute.'.format(engine))
@@ -0,0 +1,15 @@
+"""
+Coroutines for the tests of async_run(), which are in their
+own module since they're a SyntaxError before Python 3.5.
+"""
+import asyncio
+
+
+def make_counting_func(running, max_running):
+    async def func(params):
+        running.append(params)
+        max_running.append(len(running))
+        await asyncio.sleep(0.01)
+        running.remove(params)
+        return params.num * 3
+    return func
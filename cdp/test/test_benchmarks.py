@@ -0,0 +1,34 @@
+from __future__ import print_function
+
+import unittest
+import os
+import json
+import shutil
+import tempfile
+from cdp.benchmarks import run
+from cdp.benchmarks.workloads import WORKLOADS
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_main(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            output = os.path.join(tmp_dir, 'results.json')
+            run.main(['-s', '2', '-e', 'serial', 'threaded', '-n', '2', '-o', output])
+            with open(output) as f:
+                results = json.load(f)['results']
+            self.assertEqual(len(results), 2 * len(WORKLOADS))
+            self.assertEqual(set(r['n'] for r in results), set([2]))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_large_result_memory_is_bounded(self):
+        _, make_parameters = WORKLOADS['large_result']
+        for n in [10, 1000, 100000]:
+            parameters = make_parameters(n)
+            self.assertLessEqual(sum(p.size for p in parameters), 256 * 1024 * 1024)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,7 @@ from __future__ import print_function
 
 import unittest
 import os
+import pickle
 import cdp.cdp_parameter
 
 
@@ -53,6 +54,31 @@ class TestCDPParameter(unittest.TestCase):
                 os.remove('CDPParameterFile2.py')
             if os.path.exists('CDPParameterFile2.pyc'):
                 os.remove('CDPParameterFile2.pyc')
+
+    def test_copy_on_write(self):
+        # Not a MyCDPParameter, since a class in a class can't be pickled in Python 2.
+        param = cdp.cdp_parameter.CDPParameter()
+        param.seasons = ['ANN', 'DJF']
+        param.vars = ['PRECT']
+        p = param.copy_on_write()
+        self.assertEqual(vars(p), vars(param))
+        self.assertIs(p.seasons, param.seasons)
+
+        p.vars = ['TREFHT']
+        del p.seasons
+        self.assertEqual(param.vars, ['PRECT'])
+        self.assertEqual(param.seasons, ['ANN', 'DJF'])
+
+        p2 = pickle.loads(pickle.dumps(p))
+        self.assertEqual(vars(p2), {'vars': ['TREFHT']})
+
+    def test_add_doesnt_share_values(self):
+        other = self.MyCDPParameter()
+        other.seasons = ['ANN']
+        p = self.cdp_parameter + other
+        p.seasons.append('DJF')
+        self.assertEqual(other.seasons, ['ANN'])
+        self.assertEqual(p.seasons, ['ANN', 'DJF'])
     
 
 if __name__ == '__main__':
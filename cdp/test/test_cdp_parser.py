@@ -5,7 +5,23 @@ import os
 import sys
 import cdp.cdp_parameter
 import cdp.cdp_parser
+import cdp._parse_cache
 import os
+import shutil
+import tempfile
+import time
+
+
+def setUpModule():
+    # Don't put the parsed files used in the tests in the user's cache.
+    global cache_dir
+    cache_dir = tempfile.mkdtemp()
+    os.environ['CDP_CACHE_DIR'] = cache_dir
+
+
+def tearDownModule():
+    del os.environ['CDP_CACHE_DIR']
+    shutil.rmtree(cache_dir)
 
 
 class TestCDPParserOverload(unittest.TestCase):
@@ -527,6 +543,22 @@ class TestCDPParser(unittest.TestCase):
             if os.path.exists('test__is_arg_default_value.cfg'):
                 os.remove('test__is_arg_default_value.cfg')
     
+    def test__is_arg_default_value_after_adding_args(self):
+        self.cdp_parser.add_argument('--dv', type=str, dest='default_val', required=False)
+        self.cdp_parser.add_args_and_values(['--dv=cmdline_default_val'])
+        self.assertFalse(self.cdp_parser._is_arg_default_value('default_val'))
+        self.assertTrue(self.cdp_parser._is_arg_default_value('other_val'))
+
+        # An arg that's added after the parse, but was in the command, isn't a default.
+        self.cdp_parser.cmd_used = ['--dv=cmdline_default_val', '--ov', 'x']
+        self.cdp_parser.add_argument('--ov', type=str, dest='other_val', required=False)
+        self.assertFalse(self.cdp_parser._is_arg_default_value('other_val'))
+
+        # Changing the command used is picked up without adding an arg.
+        self.cdp_parser.cmd_used = ['--ov', 'x']
+        self.assertTrue(self.cdp_parser._is_arg_default_value('default_val'))
+        self.assertFalse(self.cdp_parser._is_arg_default_value('other_val'))
+
     def test_cmdline_args_with_default_values(self):
         self.cdp_parser.add_argument(
                 '--default_val',
@@ -652,6 +684,80 @@ class TestCDPParser(unittest.TestCase):
             if os.path.exists('test_granulate.cfg'):
                 os.remove('test_granulate.cfg')
 
+    def test_granulate_lazy(self):
+        p1 = cdp.cdp_parameter.CDPParameter()
+        p1.nums = [0, 1]
+        p1.letters = ['A', 'B', 'C']
+        p1.granulate = ['nums', 'letters']
+        p2 = cdp.cdp_parameter.CDPParameter()
+        p2.info = 'Not granulated.'
+
+        params = self.cdp_parser.granulate([p1, p2], lazy=True)
+        self.assertEqual(len(params), 7)
+        self.assertEqual(params[4].nums, [1])
+        self.assertEqual(params[4].letters, ['B'])
+        self.assertIs(params[-1], p2)
+        self.assertEqual([(p.nums, p.letters) for p in params[:6]],
+                         [(p.nums, p.letters) for p in self.cdp_parser.granulate([p1])])
+        # The original parameters object isn't changed.
+        self.assertEqual(p1.nums, [0, 1])
+        with self.assertRaises(IndexError):
+            params[7]
+
+    def test_orig_parameters_loaded_once(self):
+        loaded = []
+        class CountingCDPParameter(self.MyCDPParameter):
+            def load_parameter_from_py(self, parameter_file_path):
+                loaded.append(parameter_file_path)
+                super(CountingCDPParameter, self).load_parameter_from_py(parameter_file_path)
+
+        parser = cdp.cdp_parser.CDPParser(CountingCDPParameter)
+        parser.add_args_and_values(['-p', self.prefix + 'test_load_default_args.py'])
+        p1 = parser.get_orig_parameters(argparse_vals_only=False)
+        p1.vars = ['v3']
+        p2 = parser.get_orig_parameters(argparse_vals_only=False)
+        self.assertEqual(len(loaded), 1)
+        self.assertEqual(p2.vars, ['v1', 'v2'])
+
+        # Parsing again loads the file again.
+        parser.add_args_and_values(['-p', self.prefix + 'test_load_default_args.py'])
+        parser.get_orig_parameters(argparse_vals_only=False)
+        self.assertEqual(len(loaded), 2)
+
+    def test_parse_cache(self):
+        num_cached = len(os.listdir(cache_dir))
+        try:
+            self.write_file('test_parse_cache.cfg', '[Diags]\nnum = 0\nvars = [a, b]\n')
+            params = self.cdp_parser.get_parameters_from_cfg('test_parse_cache.cfg', argparse_vals_only=False)
+            self.assertEqual(params[0].vars, ['a', 'b'])
+            self.assertEqual(len(os.listdir(cache_dir)), num_cached + 1)
+            params = self.cdp_parser.get_parameters_from_cfg('test_parse_cache.cfg', argparse_vals_only=False)
+            self.assertEqual((params[0].num, params[0].vars), (0, ['a', 'b']))
+
+            # A changed file isn't loaded from the cache,
+            # and its new entry replaces the old one.
+            self.write_file('test_parse_cache.cfg', '[Diags]\nnum = 1\n')
+            params = self.cdp_parser.get_parameters_from_cfg('test_parse_cache.cfg', argparse_vals_only=False)
+            self.assertEqual(params[0].num, 1)
+            self.assertFalse(hasattr(params[0], 'vars'))
+            self.assertEqual(len(os.listdir(cache_dir)), num_cached + 1)
+        finally:
+            if os.path.exists('test_parse_cache.cfg'):
+                os.remove('test_parse_cache.cfg')
+
+    def test_parse_cache_removes_unused_entries(self):
+        old_entry = os.path.join(cache_dir, 'unused.pkl')
+        self.write_file(old_entry, '')
+        last_used = time.time() - cdp._parse_cache.MAX_AGE - 1
+        os.utime(old_entry, (last_used, last_used))
+        try:
+            self.write_file('test_parse_cache_removes_unused_entries.cfg', '[Diags]\nnum = 0\n')
+            self.cdp_parser.get_parameters_from_cfg('test_parse_cache_removes_unused_entries.cfg', argparse_vals_only=False)
+            self.assertFalse(os.path.exists(old_entry))
+        finally:
+            if os.path.exists('test_parse_cache_removes_unused_entries.cfg'):
+                os.remove('test_parse_cache_removes_unused_entries.cfg')
+
     def test_cfg_hash(self):
         cfg_str = '[#]\n'
         cfg_str += '[#]\n'
@@ -683,6 +789,21 @@ class TestCDPParser(unittest.TestCase):
             if os.path.exists('test_cfg_hash.cfg'):
                 os.remove('test_cfg_hash.cfg')
 
+    def test_cfg_hash_titles_are_deterministic(self):
+        cfg_str = '[#]\nnum = 0\n[Diags1]\nnum = 1\n[#]\nnum = 0\n[#]\nnum = 2\n'
+        try:
+            self.write_file('test_cfg_hash_titles.cfg', cfg_str)
+            lines = list(self.cdp_parser._create_cfg_hash_titles('test_cfg_hash_titles.cfg'))
+            titles = [l for l in lines if l.startswith('[')]
+            self.assertEqual(len(titles), 4)
+            self.assertEqual(titles[1], '[Diags1]\n')
+            # Sections with the same contents still get different titles.
+            self.assertEqual(len(set(titles)), 4)
+            self.assertEqual(lines, list(self.cdp_parser._create_cfg_hash_titles('test_cfg_hash_titles.cfg')))
+        finally:
+            if os.path.exists('test_cfg_hash_titles.cfg'):
+                os.remove('test_cfg_hash_titles.cfg')
+
     def test_selector(self):
         self.cdp_parser.add_args_and_values(['-p', self.prefix + 'test_selector.py', '-d', self.prefix + 'test_selector.cfg'])
         params = self.cdp_parser.get_parameters(argparse_vals_only=False)
@@ -704,6 +825,64 @@ class TestCDPParser(unittest.TestCase):
         self.assertEqual(params[3].seasons, ['SON'])
         self.assertEqual(params[3].case_id, 'new_run')
 
+    def test_select_with_unhashable_values(self):
+        main_param = cdp.cdp_parameter.CDPParameter()
+        main_param.selectors = ['seasons', 'regions']
+        main_param.seasons = ['ANN', 'JJA']
+        main_param.regions = [['land', 'ocean'], 'global']
+
+        params = []
+        for season in ['ANN', 'DJF', 'JJA']:
+            for region in [['land', 'ocean'], 'global', ['land']]:
+                p = cdp.cdp_parameter.CDPParameter()
+                p.seasons = [season]
+                p.regions = [region]
+                params.append(p)
+
+        selected = self.cdp_parser.select(main_param, params)
+        self.assertEqual([(p.seasons, p.regions) for p in selected],
+                         [(['ANN'], [['land', 'ocean']]), (['ANN'], ['global']),
+                          (['JJA'], [['land', 'ocean']]), (['JJA'], ['global'])])
+
+    def test_select_creates_granulated_parameters_once(self):
+        copies = []
+        class CountingCDPParameter(cdp.cdp_parameter.CDPParameter):
+            def copy_on_write(self):
+                copies.append(self)
+                return super(CountingCDPParameter, self).copy_on_write()
+
+        main_param = cdp.cdp_parameter.CDPParameter()
+        main_param.selectors = ['seasons']
+        main_param.seasons = ['ANN', 'JJA']
+        p = CountingCDPParameter()
+        p.seasons = ['ANN', 'DJF', 'JJA']
+        p.granulate = ['seasons']
+
+        selected = self.cdp_parser.select(main_param, cdp.cdp_parser.GranulatedParameters([p]))
+        self.assertEqual([s.seasons for s in selected], [['ANN'], ['JJA']])
+        self.assertEqual(len(copies), 3)
+
+    def test_granulate_with_main_parameters(self):
+        main_param = cdp.cdp_parameter.CDPParameter()
+        main_param.selectors = ['seasons', 'variables']
+        main_param.seasons = ['ANN', 'JJA']
+        main_param.variables = ['PRECT', 'TREFHT']
+
+        p1 = cdp.cdp_parameter.CDPParameter()
+        p1.seasons = ['ANN', 'DJF', 'MAM', 'JJA']
+        p1.variables = ['PRECT', 'PS', 'TREFHT']
+        p1.granulate = ['seasons', 'variables']
+        p2 = cdp.cdp_parameter.CDPParameter()
+        p2.seasons = ['ANN']
+        p2.variables = ['PS']
+        p2.granulate = ['seasons']
+
+        params = self.cdp_parser.granulate([p1, p2], main_parameters=main_param)
+        expected = self.cdp_parser.select(main_param, self.cdp_parser.granulate([p1, p2]))
+        self.assertEqual(len(params), 4)
+        self.assertEqual([(p.seasons, p.variables) for p in params],
+                         [(p.seasons, p.variables) for p in expected])
+
     def test_argparse_vals_only(self):
         self.cdp_parser.add_args_and_values(['-p', self.prefix + 'test_argparse_vals_only.py'])
         params = self.cdp_parser.get_parameters(argparse_vals_only=True)
@@ -2,6 +2,15 @@ from __future__ import print_function
 
 import unittest
 import os
+import sys
+import shutil
+import tempfile
+import collections
+try:
+    import numpy
+except ImportError:
+    numpy = None
+from dask.distributed import LocalCluster
 import cdp.cdp_parameter
 import cdp.cdp_parser
 import cdp.cdp_run
@@ -12,6 +21,59 @@ class MyCDPParameter(cdp.cdp_parameter.CDPParameter):
         pass
 
 
+class MemoryCDPParameter(MyCDPParameter):
+    def __init__(self, num):
+        self.num = num
+
+    def estimate_memory(self):
+        return '{}GB'.format(self.num)
+
+
+def sum_shared(params):
+    return float(cdp.cdp_run.shared('array').sum()) + params.num
+
+
+def count_shared(params):
+    return int(cdp.cdp_run.shared('masked').count()) + params.num
+
+
+def make_array(params):
+    return {'field': numpy.full((512, 512), params.num, dtype='float64'), 'num': params.num}
+
+
+def make_masked_array(params):
+    field = numpy.ma.masked_less(numpy.arange(512 * 512, dtype='float64'), params.num)
+    return {'field': field, 'num': params.num}
+
+
+ArrayResult = collections.namedtuple('ArrayResult', 'field num')
+
+
+def make_array_containers(params):
+    field = numpy.full((512, 512), params.num, dtype='float64')
+    return ArrayResult(field, params.num), collections.defaultdict(list, {'field': field})
+
+
+def get_pid_and_preloaded(params):
+    import sys
+    return os.getpid(), 'colorsys' in sys.modules
+
+
+def add_inputs(params, inputs):
+    return params.num + sum(inputs)
+
+
+def add_inputs_and_shared(params, inputs):
+    return params.num + sum(inputs) + cdp.cdp_run.shared('x')
+
+
+def sleep_and_time(params):
+    import time
+    start = time.time()
+    time.sleep(0.2)
+    return start, time.time()
+
+
 class MyCDPParser(cdp.cdp_parser.CDPParser):
     def __init__(self, *args, **kwargs):
         super(MyCDPParser, self).__init__(
@@ -28,6 +90,18 @@ class MyCDPParser(cdp.cdp_parser.CDPParser):
             required=False)
 
 
+def setUpModule():
+    # Don't put the parsed files used in the tests in the user's cache.
+    global cache_dir
+    cache_dir = tempfile.mkdtemp()
+    os.environ['CDP_CACHE_DIR'] = cache_dir
+
+
+def tearDownModule():
+    del os.environ['CDP_CACHE_DIR']
+    shutil.rmtree(cache_dir)
+
+
 class TestCDPRun(unittest.TestCase):
 
     def write_file(self, file_name, contents):
@@ -65,6 +139,600 @@ class TestCDPRun(unittest.TestCase):
             if os.path.exists('diags.cfg'):
                 os.remove('diags.cfg')
 
+    def test_serial_with_checkpoint_dir(self):
+        ran = []
+
+        def func(params):
+            ran.append(params.num)
+            if params.num == 15 and len(ran) < 4:
+                raise RuntimeError('Simulated crash.')
+            return params.num * 2
+
+        checkpoint_dir = tempfile.mkdtemp()
+        try:
+            self.write_file('diags.cfg', self.cfg_str)
+
+            self.cdp_parser.add_args_and_values(['-d', 'diags.cfg'])
+            params = self.cdp_parser.get_parameters(argparse_vals_only=False)
+
+            with self.assertRaises(RuntimeError):
+                cdp.cdp_run.serial(func, params, checkpoint_dir=checkpoint_dir)
+            self.assertEqual(ran, [5, 10, 15])
+
+            # Only the parameters that failed or weren't run are run again.
+            results = cdp.cdp_run.serial(func, params, checkpoint_dir=checkpoint_dir)
+            self.assertEqual(results, [10, 20, 30, 40])
+            self.assertEqual(ran, [5, 10, 15, 15, 20])
+
+            results = cdp.cdp_run.serial(func, params, checkpoint_dir=checkpoint_dir)
+            self.assertEqual(results, [10, 20, 30, 40])
+            self.assertEqual(len(ran), 5)
+
+        finally:
+            shutil.rmtree(checkpoint_dir)
+            if os.path.exists('diags.cfg'):
+                os.remove('diags.cfg')
+
+    @unittest.skipIf(numpy is None, 'NumPy is needed for array parameters.')
+    def test_serial_with_checkpoint_dir_and_large_arrays(self):
+        # The repr() of both arrays is the same, since it leaves out the middle.
+        a = MyCDPParameter()
+        a.levels = numpy.arange(2000.0)
+        b = MyCDPParameter()
+        b.levels = numpy.arange(2000.0)
+        b.levels[1000] = -1.0
+
+        checkpoint_dir = tempfile.mkdtemp()
+        try:
+            results = cdp.cdp_run.serial(lambda p: float(p.levels.sum()), [a, b],
+                                         checkpoint_dir=checkpoint_dir)
+            self.assertEqual(results, [1999000.0, 1997999.0])
+            results = cdp.cdp_run.serial(lambda p: float(p.levels.sum()), [a, b],
+                                         checkpoint_dir=checkpoint_dir)
+            self.assertEqual(results, [1999000.0, 1997999.0])
+        finally:
+            shutil.rmtree(checkpoint_dir)
+
+    def test_serial_with_report(self):
+        import csv
+        import json
+
+        def func(params):
+            if params.num == 10:
+                raise ValueError('Bad num.')
+            return params.num
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            self.write_file('diags.cfg', self.cfg_str)
+
+            self.cdp_parser.add_args_and_values(['-d', 'diags.cfg'])
+            params = self.cdp_parser.get_parameters(argparse_vals_only=False)
+
+            report = cdp.cdp_run.RunReport()
+            with self.assertRaises(ValueError):
+                cdp.cdp_run.serial(func, params, report=report)
+
+            # All of the tasks ran, even after the second one failed.
+            self.assertEqual(len(report.records), 4)
+            statuses = [r['status'] for r in report.records]
+            self.assertEqual(statuses, ['success', 'error', 'success', 'success'])
+            self.assertIn('Bad num.', report.records[1]['exception'])
+            self.assertEqual(report.records[0]['pid'], os.getpid())
+
+            report.to_json(os.path.join(tmp_dir, 'report.json'))
+            with open(os.path.join(tmp_dir, 'report.json')) as f:
+                self.assertEqual(len(json.load(f)), 4)
+            report.to_csv(os.path.join(tmp_dir, 'report.csv'))
+            with open(os.path.join(tmp_dir, 'report.csv')) as f:
+                self.assertEqual(len(list(csv.DictReader(f))), 4)
+
+        finally:
+            shutil.rmtree(tmp_dir)
+            if os.path.exists('diags.cfg'):
+                os.remove('diags.cfg')
+
+    def test_serial_with_dedup(self):
+        ran = []
+
+        def func(params):
+            ran.append(params.num)
+            return params.num * 2
+
+        cfg_str = self.cfg_str + '[Diags5]\nnum = 10\n[Diags6]\nnum = 5\n'
+        try:
+            self.write_file('diags.cfg', cfg_str)
+
+            self.cdp_parser.add_args_and_values(['-d', 'diags.cfg'])
+            params = self.cdp_parser.get_parameters(argparse_vals_only=False)
+
+            results = cdp.cdp_run.serial(func, params, dedup=True)
+            self.assertEqual(results, [10, 20, 30, 40, 20, 10])
+            self.assertEqual(ran, [5, 10, 15, 20])
+
+        finally:
+            if os.path.exists('diags.cfg'):
+                os.remove('diags.cfg')
+
+    @unittest.skipIf(numpy is None, 'NumPy is needed for array parameters.')
+    def test_serial_with_dedup_and_large_arrays(self):
+        a = MyCDPParameter()
+        a.levels = numpy.arange(2000.0)
+        b = MyCDPParameter()
+        b.levels = numpy.arange(2000.0)
+        b.levels[1000] = -1.0
+        c = MyCDPParameter()
+        c.levels = numpy.arange(2000.0)
+
+        results = cdp.cdp_run.serial(lambda p: float(p.levels.sum()), [a, b, c], dedup=True)
+        self.assertEqual(results, [1999000.0, 1997999.0, 1999000.0])
+
+    def test_serial_with_dedup_and_functions(self):
+        import functools
+        params = []
+        for f in [functools.partial(pow, 2), functools.partial(pow, 3),
+                  lambda x: x + 1, lambda x: x + 2, functools.partial(pow, 2)]:
+            p = MyCDPParameter()
+            p.f = f
+            params.append(p)
+        for n in [10, 20]:
+            p = MyCDPParameter()
+            p.f = lambda x, n=n: x * n
+            params.append(p)
+
+        results = cdp.cdp_run.serial(lambda p: p.f(2), params, dedup=True)
+        self.assertEqual(results, [4, 9, 3, 4, 4, 20, 40])
+
+    def test_serial_with_sink(self):
+
+        def func(params):
+            return {'num': params.num}
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            self.write_file('diags.cfg', self.cfg_str)
+
+            self.cdp_parser.add_args_and_values(['-d', 'diags.cfg'])
+            params = self.cdp_parser.get_parameters(argparse_vals_only=False)
+
+            sinks = [os.path.join(tmp_dir, 'results'),
+                     cdp.cdp_run.AppendFileStore(os.path.join(tmp_dir, 'results.bin'))]
+            for sink in sinks:
+                results = cdp.cdp_run.serial(func, params, sink=sink)
+                self.assertEqual(len(results), 4)
+                self.assertEqual(results[1], {'num': 10})
+                self.assertEqual(results[-1], {'num': 20})
+                self.assertEqual([r['num'] for r in results], [5, 10, 15, 20])
+                with self.assertRaises(IndexError):
+                    results[-5]
+
+            # A record that was cut off by a crash is removed when the file is opened again.
+            with open(os.path.join(tmp_dir, 'results.bin'), 'ab') as f:
+                f.write(b'\x00\x00\x00')
+            store = cdp.cdp_run.AppendFileStore(os.path.join(tmp_dir, 'results.bin'))
+            self.assertEqual(store.load(params[2]), {'num': 15})
+
+        finally:
+            shutil.rmtree(tmp_dir)
+            if os.path.exists('diags.cfg'):
+                os.remove('diags.cfg')
+
+    def test_serial_with_sink_and_checkpoint_dir(self):
+        ran = []
+
+        def func(params):
+            ran.append(params.num)
+            return params.num * 2
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            self.write_file('diags.cfg', self.cfg_str)
+
+            self.cdp_parser.add_args_and_values(['-d', 'diags.cfg'])
+            params = self.cdp_parser.get_parameters(argparse_vals_only=False)
+
+            checkpoint_dir = os.path.join(tmp_dir, 'checkpoints')
+            results = cdp.cdp_run.serial(func, params, checkpoint_dir=checkpoint_dir,
+                                         sink=os.path.join(tmp_dir, 's1'))
+            self.assertEqual(list(results), [10, 20, 30, 40])
+
+            # The results, and not what the sink returns, were checkpointed.
+            results = cdp.cdp_run.serial(func, params, checkpoint_dir=checkpoint_dir)
+            self.assertEqual(results, [10, 20, 30, 40])
+
+            # A new sink gets the checkpointed results without running them again.
+            results = cdp.cdp_run.serial(func, params, checkpoint_dir=checkpoint_dir,
+                                         sink=os.path.join(tmp_dir, 's2'))
+            self.assertEqual(list(results), [10, 20, 30, 40])
+            self.assertEqual(ran, [5, 10, 15, 20])
+
+        finally:
+            shutil.rmtree(tmp_dir)
+            if os.path.exists('diags.cfg'):
+                os.remove('diags.cfg')
+
+    def test_threaded(self):
+
+        def func(params):
+            return params.num + 1
+
+        try:
+            self.write_file('diags.cfg', self.cfg_str)
+
+            self.cdp_parser.add_args_and_values(['-d', 'diags.cfg', '-n', '2'])
+            params = self.cdp_parser.get_parameters(argparse_vals_only=False)
+
+            results = cdp.cdp_run.threaded(func, params)
+            self.assertEqual(results, [6, 11, 16, 21])
+
+        finally:
+            if os.path.exists('diags.cfg'):
+                os.remove('diags.cfg')
+
+    @unittest.skipIf(sys.version_info < (3, 5), 'async def is needed for coroutines.')
+    def test_async_run(self):
+        from async_funcs import make_counting_func
+
+        running = []
+        max_running = []
+        func = make_counting_func(running, max_running)
+
+        try:
+            self.write_file('diags.cfg', self.cfg_str)
+
+            self.cdp_parser.add_args_and_values(['-d', 'diags.cfg'])
+            params = self.cdp_parser.get_parameters(argparse_vals_only=False)
+
+            results = cdp.cdp_run.async_run(func, params, concurrency=2)
+            self.assertEqual(results, [15, 30, 45, 60])
+            self.assertEqual(max(max_running), 2)
+
+            results = cdp.cdp_run.async_iter(func, params, concurrency=2)
+            self.assertEqual(sorted(r for _, r in results), [15, 30, 45, 60])
+
+            # Generators work too, and num_workers is read from the first parameter.
+            params[0].num_workers = 1
+            del max_running[:]
+            results = cdp.cdp_run.async_run(func, (p for p in params))
+            self.assertEqual(results, [15, 30, 45, 60])
+            self.assertEqual(max(max_running), 1)
+            results = cdp.cdp_run.async_iter(func, (p for p in params))
+            self.assertEqual(sorted(r for _, r in results), [15, 30, 45, 60])
+            self.assertEqual(cdp.cdp_run.async_run(func, iter([])), [])
+            self.assertEqual(list(cdp.cdp_run.async_iter(func, iter([]))), [])
+
+        finally:
+            if os.path.exists('diags.cfg'):
+                os.remove('diags.cfg')
+
+    @unittest.skipIf(sys.version_info < (3, 7), 'memory_limit needs Python 3.7.')
+    def test_multiprocess_with_memory_limit(self):
+        params = [MemoryCDPParameter(n) for n in [5, 10, 15, 20, 30]]
+        results = cdp.cdp_run.multiprocess(sleep_and_time, params, num_workers=4,
+                                           memory_limit='20GB')
+
+        self.assertEqual(len(results), 5)
+        for start, _ in results:
+            running = [p.num for p, (s, e) in zip(params, results) if s <= start < e]
+            # The 30GB one is over the limit, so it must've run by itself.
+            if 30 in running:
+                self.assertEqual(running, [30])
+            else:
+                self.assertLessEqual(sum(running), 20)
+
+    @unittest.skipIf(numpy is None, 'NumPy is needed for memory-mapping shared arrays.')
+    def test_multiprocess_with_shared_array(self):
+        params = [MemoryCDPParameter(n) for n in [1, 2]]
+        cdp.cdp_run.share('array', numpy.ones(1000))
+        try:
+            results = cdp.cdp_run.multiprocess(sum_shared, params, num_workers=2)
+            self.assertEqual(results, [1001.0, 1002.0])
+        finally:
+            cdp.cdp_run.unshare('array')
+
+    @unittest.skipIf(numpy is None, 'NumPy is needed for masked arrays.')
+    def test_multiprocess_with_shared_masked_array(self):
+        params = [MemoryCDPParameter(n) for n in [1, 2]]
+        cdp.cdp_run.share('masked', numpy.ma.masked_less(numpy.arange(1000.0), 10))
+        try:
+            results = cdp.cdp_run.multiprocess(count_shared, params, num_workers=2)
+            self.assertEqual(results, [991, 992])
+        finally:
+            cdp.cdp_run.unshare('masked')
+
+    @unittest.skipIf(numpy is None, 'NumPy is needed for array results.')
+    def test_multiprocess_with_mmap_results(self):
+        params = [MemoryCDPParameter(n) for n in [1, 2, 3]]
+        results = cdp.cdp_run.multiprocess(make_array, params, num_workers=2, mmap_results=True)
+
+        for p, r in zip(params, results):
+            self.assertEqual(r['num'], p.num)
+            self.assertIsInstance(r['field'], numpy.memmap)
+            self.assertTrue((r['field'] == p.num).all())
+
+    @unittest.skipIf(numpy is None, 'NumPy is needed for array results.')
+    def test_multiprocess_with_mmap_results_in_namedtuples(self):
+        params = [MemoryCDPParameter(n) for n in [1, 2]]
+        results = cdp.cdp_run.multiprocess(make_array_containers, params,
+                                           num_workers=2, mmap_results=True)
+
+        for p, (named, default) in zip(params, results):
+            self.assertIsInstance(named, ArrayResult)
+            self.assertEqual(named.num, p.num)
+            self.assertIsInstance(named.field, numpy.memmap)
+            self.assertIsInstance(default, collections.defaultdict)
+            self.assertIsInstance(default['field'], numpy.memmap)
+            self.assertEqual(default['missing'], [])
+
+    @unittest.skipIf(numpy is None, 'NumPy is needed for array results.')
+    def test_multiprocess_with_mmap_results_and_masked_arrays(self):
+        params = [MemoryCDPParameter(n) for n in [1, 2]]
+        results = cdp.cdp_run.multiprocess(make_masked_array, params,
+                                           num_workers=2, mmap_results=True)
+
+        for p, r in zip(params, results):
+            self.assertIsInstance(r['field'], numpy.ma.MaskedArray)
+            self.assertEqual(r['field'].count(), 512 * 512 - p.num)
+
+    @unittest.skipIf(sys.version_info < (3, 7), 'The worker pool needs Python 3.7.')
+    def test_multiprocess_with_worker_pool(self):
+        params = [MemoryCDPParameter(n) for n in range(6)]
+        cdp.cdp_run.start_worker_pool(2, preload=['colorsys'])
+        try:
+            results = cdp.cdp_run.multiprocess(get_pid_and_preloaded, params)
+            results += cdp.cdp_run.multiprocess(get_pid_and_preloaded, params, memory_limit='1GB')
+
+            # Both runs used the same two workers, which had the module preloaded.
+            self.assertLessEqual(len(set(pid for pid, _ in results)), 2)
+            self.assertTrue(all(preloaded for _, preloaded in results))
+        finally:
+            cdp.cdp_run.shutdown_worker_pool()
+        self.assertIsNone(cdp.cdp_run.worker_pool)
+
+    def test_distribute_with_shared_object(self):
+
+        def func(params):
+            return cdp.cdp_run.shared('offsets')[params.num]
+
+        cluster = LocalCluster(n_workers=1, processes=False, dashboard_address=None)
+        cdp.cdp_run.share('offsets', {5: 'a', 10: 'b', 15: 'c', 20: 'd'})
+        try:
+            self.write_file('diags.cfg', self.cfg_str)
+
+            self.cdp_parser.add_args_and_values(['-d', 'diags.cfg'])
+            params = self.cdp_parser.get_parameters(argparse_vals_only=False)
+
+            results = cdp.cdp_run.distribute(func, params, cluster.scheduler_address)
+            self.assertEqual(results, ['a', 'b', 'c', 'd'])
+
+        finally:
+            cdp.cdp_run.unshare('offsets')
+            cdp.cdp_run.close_clients()
+            cluster.close()
+            if os.path.exists('diags.cfg'):
+                os.remove('diags.cfg')
+
+    def test_imap_with_generator(self):
+        produced = []
+
+        def generate():
+            for n in range(20):
+                produced.append(n)
+                yield MemoryCDPParameter(n)
+
+        def func(params):
+            return params.num * 2
+
+        config = MemoryCDPParameter(0)
+        config.num_workers = 2
+        engines = ['serial', 'threaded']
+        # The multiprocess engine of imap() needs Python 3.7.
+        if sys.version_info >= (3, 7):
+            engines.append('multiprocess')
+        for engine in engines:
+            del produced[:]
+            results = cdp.cdp_run.imap(func, generate(), engine, window=3, config=config)
+            for i, r in enumerate(results):
+                self.assertEqual(r, i * 2)
+                # Only the window of parameters after this one were made.
+                self.assertLessEqual(len(produced), i + 1 + 3)
+            self.assertEqual(len(produced), 20)
+
+        self.assertEqual(cdp.cdp_run.multiprocess(func, generate(), num_workers=2),
+                         list(range(0, 40, 2)))
+
+    def dag_parameters(self):
+        names = ['climo', 'regrid', 'metrics', 'plot', 'other']
+        params = [MemoryCDPParameter(n) for n in [1, 10, 100, 1000, 5]]
+        for name, p in zip(names, params):
+            p.name = name
+        # Listed out of order on purpose, and by name or by parameter.
+        params[3].depends_on = ['metrics', params[0]]
+        params[2].depends_on = ['regrid']
+        params[1].depends_on = [params[0]]
+        return params
+
+    def test_dag(self):
+        params = self.dag_parameters()
+        expected = [1, 11, 111, 1112, 5]
+        self.assertEqual(cdp.cdp_run.dag(add_inputs, params), expected)
+        self.assertEqual(cdp.cdp_run.dag(add_inputs, iter(params)), expected)
+        # The multiprocess engine of dag() needs Python 3.7.
+        if sys.version_info >= (3, 7):
+            self.assertEqual(cdp.cdp_run.dag(add_inputs, params, 'multiprocess', num_workers=2),
+                             expected)
+
+        cluster = LocalCluster(n_workers=1, processes=False, dashboard_address=None)
+        try:
+            results = cdp.cdp_run.dag(add_inputs, params, 'distribute',
+                                      scheduler_addr=cluster.scheduler_address)
+            self.assertEqual(results, expected)
+        finally:
+            cdp.cdp_run.close_clients()
+            cluster.close()
+
+        params[0].depends_on = ['plot']
+        with self.assertRaises(RuntimeError):
+            cdp.cdp_run.dag(add_inputs, params)
+
+    def test_dag_with_shared_object(self):
+        params = self.dag_parameters()
+        expected = [101, 211, 411, 1612, 105]
+        cdp.cdp_run.share('x', 100)
+        cluster = LocalCluster(n_workers=1, processes=False, dashboard_address=None)
+        try:
+            engines = ['serial', 'distribute']
+            # The multiprocess engine of dag() needs Python 3.7.
+            if sys.version_info >= (3, 7):
+                engines.append('multiprocess')
+            for engine in engines:
+                results = cdp.cdp_run.dag(add_inputs_and_shared, params, engine, num_workers=2,
+                                          scheduler_addr=cluster.scheduler_address)
+                self.assertEqual(results, expected)
+        finally:
+            cdp.cdp_run.unshare('x')
+            cdp.cdp_run.close_clients()
+            cluster.close()
+
+    def test_distribute_iter(self):
+
+        def func(params):
+            return params.num * 2
+
+        cluster = LocalCluster(n_workers=1, processes=False, dashboard_address=None)
+        try:
+            self.write_file('diags.cfg', self.cfg_str)
+
+            self.cdp_parser.add_args_and_values(['-d', 'diags.cfg'])
+            params = self.cdp_parser.get_parameters(argparse_vals_only=False)
+
+            results = cdp.cdp_run.distribute_iter(func, params, cluster.scheduler_address)
+            results = list(results)
+
+            self.assertEqual(len(results), 4)
+            for p, r in results:
+                self.assertEqual(r, p.num * 2)
+
+        finally:
+            cdp.cdp_run.close_clients()
+            cluster.close()
+            if os.path.exists('diags.cfg'):
+                os.remove('diags.cfg')
+
+    def test_distribute_reuses_client(self):
+
+        def func(params):
+            return params.num
+
+        cluster = LocalCluster(n_workers=1, processes=False, dashboard_address=None)
+        try:
+            self.write_file('diags.cfg', self.cfg_str)
+
+            self.cdp_parser.add_args_and_values(['-d', 'diags.cfg'])
+            params = self.cdp_parser.get_parameters(argparse_vals_only=False)
+
+            addr = cluster.scheduler_address
+            cdp.cdp_run.distribute(func, params, addr)
+            client = cdp.cdp_run.client_pool.get(addr)
+            report = cdp.cdp_run.RunReport()
+            results = cdp.cdp_run.distribute(func, params, addr, report=report)
+
+            self.assertIs(cdp.cdp_run.client_pool.get(addr), client)
+            self.assertEqual(results, [5, 10, 15, 20])
+            self.assertEqual(len(report.records), 4)
+
+        finally:
+            cdp.cdp_run.close_clients()
+            cluster.close()
+            if os.path.exists('diags.cfg'):
+                os.remove('diags.cfg')
+
+    def test_distribute_with_timeout_and_errors(self):
+        import time
+
+        def func(params):
+            if params.num == 10:
+                raise ValueError('Bad num.')
+            if params.num == 15:
+                time.sleep(5)
+            return params.num
+
+        # A task that timed out keeps its thread until it returns,
+        # so have enough threads for the ones left from each call.
+        cluster = LocalCluster(n_workers=1, threads_per_worker=8, processes=False,
+                               dashboard_address=None)
+        try:
+            self.write_file('diags.cfg', self.cfg_str)
+
+            self.cdp_parser.add_args_and_values(['-d', 'diags.cfg'])
+            params = self.cdp_parser.get_parameters(argparse_vals_only=False)
+
+            addr = cluster.scheduler_address
+            results = cdp.cdp_run.distribute(func, params, addr, timeout=2,
+                                             errors='return_exceptions')
+            self.assertEqual(results[0], 5)
+            self.assertIsInstance(results[1], ValueError)
+            self.assertIsInstance(results[2], cdp.cdp_run.TaskTimeoutError)
+            self.assertEqual(results[3], 20)
+
+            # Tasks that timed out are in the report too.
+            report = cdp.cdp_run.RunReport()
+            results = cdp.cdp_run.distribute(func, params, addr, timeout=2, report=report,
+                                             errors='return_exceptions')
+            self.assertIsInstance(results[2], cdp.cdp_run.TaskTimeoutError)
+            statuses = [r['status'] for r in report.records]
+            self.assertEqual(statuses, ['success', 'error', 'error', 'success'])
+            self.assertIn('2 seconds', report.records[2]['exception'])
+
+            results = cdp.cdp_run.distribute(func, params, addr, timeout=2, errors='skip')
+            self.assertEqual(results, [5, 20])
+
+            with self.assertRaises(ValueError):
+                cdp.cdp_run.distribute(func, params, addr, timeout=2)
+
+        finally:
+            cdp.cdp_run.close_clients()
+            cluster.close()
+            if os.path.exists('diags.cfg'):
+                os.remove('diags.cfg')
+
+    def test_distribute_with_runtime_history(self):
+        import json
+        import time
+
+        def func(params):
+            time.sleep(params.num / 200.0)
+            return params.num
+
+        cluster = LocalCluster(n_workers=1, processes=False, dashboard_address=None)
+        history_dir = tempfile.mkdtemp()
+        history_file = os.path.join(history_dir, 'history.json')
+        try:
+            self.write_file('diags.cfg', self.cfg_str)
+
+            self.cdp_parser.add_args_and_values(['-d', 'diags.cfg'])
+            params = self.cdp_parser.get_parameters(argparse_vals_only=False)
+
+            addr = cluster.scheduler_address
+            results = cdp.cdp_run.distribute(func, params, addr, runtime_history=history_file)
+            self.assertEqual(results, [5, 10, 15, 20])
+            with open(history_file) as f:
+                self.assertEqual(len(json.load(f)), 4)
+
+            history = cdp.cdp_run.RuntimeHistory(history_file)
+            self.assertEqual(history.longest_first(params), [3, 2, 1, 0])
+
+            # The results are still in the order of the parameters.
+            results = cdp.cdp_run.distribute(func, params, addr, runtime_history=history_file)
+            self.assertEqual(results, [5, 10, 15, 20])
+
+        finally:
+            cdp.cdp_run.close_clients()
+            cluster.close()
+            shutil.rmtree(history_dir)
+            if os.path.exists('diags.cfg'):
+                os.remove('diags.cfg')
+
     '''
     def test_multiprocess(self):
 